@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import get_user_cache_key
+
+
+class CachedUserJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication of the views which need the user instance. The id, is_active and the md5 of the password
+    hash of the token user are cached for AUTH_USER_CACHE_TIMEOUT seconds instead of loading the user from database
+    on each request, the user is a deferred instance whose other fields are loaded only if they're read.
+    The cached user is removed when the user is saved or deleted, a user who is deactivated or whose password
+    is changed with a queryset update is rejected after at most AUTH_USER_CACHE_TIMEOUT seconds
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cache_key = get_user_cache_key(user_id)
+        cached_user = cache.get(cache_key)
+        if cached_user is None:
+            # inactive and deleted users are not cached, they're rejected by the database lookup
+            user = super().get_user(validated_token)
+            cache.set(cache_key, {
+                'id': user.id,
+                'is_active': user.is_active,
+                'password_hash': get_md5_hash_password(user.password),
+            }, settings.AUTH_USER_CACHE_TIMEOUT)
+            return user
+
+        if not cached_user['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != cached_user['password_hash']:
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return self.user_model.from_db(
+            router.db_for_read(self.user_model), ['id', 'is_active'], [cached_user['id'], cached_user['is_active']],
+        )
@@ -6,11 +6,16 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.auth.base_user import BaseUserManager
+from django.core.cache import cache
 from django.db import models
 
 from core.models import BaseModel
 
 
+def get_user_cache_key(user_id):
+    return f'AUTH_{user_id}_USER'
+
+
 class UserManager(BaseUserManager):
     """
     Custom user manager class to manage user creation
@@ -78,8 +83,8 @@ class User(AbstractBaseUser, BaseModel, PermissionsMixin):
         return f'{self.id}| {self.username}'
 
     def increase_rates_count(self, num=1):
-        self.rates_count += num
-        self.save()
+        User.objects.filter(id=self.id).update(rates_count=models.F('rates_count') + num)
+        self.refresh_from_db(fields=['rates_count'])
 
     def increase_total_rates_weight(self, weight):
         """
@@ -134,6 +139,14 @@ class User(AbstractBaseUser, BaseModel, PermissionsMixin):
         """
         Method to calculate the rate weight of the user based on rate_quality and account_weight
         """
+        self.rate_weight = self.get_rate_weight()
+        self.save()
+
+    def get_rate_weight(self):
+        """
+        Method to get the rate weight of the user based on rate_quality and account_weight without saving it,
+        needs only created_at, rates_count and total_rates_weight fields
+        """
         account_weight_ratio = 1
         rate_quality_ratio = 1
         # if user has submitted rates
@@ -145,8 +158,14 @@ class User(AbstractBaseUser, BaseModel, PermissionsMixin):
             )
         else:  # if user has not submitted any rate
             rate_weight = self.account_weight
-        self.rate_weight = round(rate_weight, 3)
-        self.save()
+        return round(rate_weight, 3)
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
+        cache.delete(get_user_cache_key(self.id))  # user of the authentication is loaded again
+
+    def delete(self, *args, **kwargs):
+        user_id = self.id
+        result = super().delete(*args, **kwargs)
+        cache.delete(get_user_cache_key(user_id))
+        return result
@@ -1,5 +1,9 @@
 import datetime
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 from account.models import User
+from blog.models import Rate
 from blog_project.celery import app
 
 
@@ -8,12 +12,29 @@ def user_rate_weight():
     """
     calculate user rate weight for users (which has rates in past 24 hours) every 24 hours
     """
-    day_before = datetime.datetime.now() - datetime.timedelta(days=1)
+    day_before = timezone.now() - datetime.timedelta(days=1)
 
-    users = User.objects.filter(rates__created_at__gte=day_before)
-
-    for user in users:
-        user.calculate_rate_weight()
+    # each user with rates in past 24 hours once, with a semi-join instead of a row per rate
+    users = User.objects.filter(Exists(Rate.objects.filter(user=OuterRef('pk'), created_at__gte=day_before)))
 
+    calculate_users_rate_weight(users)
 
 
+def calculate_users_rate_weight(users, chunk_size=None):
+    """
+    calculate rate weight of given users in keyset-paginated chunks, each chunk is loaded with only the needed
+    fields and saved with one bulk update
+    """
+    chunk_size = chunk_size or settings.USER_RATE_WEIGHT_CHUNK_SIZE
+    last_id = 0
+    while True:
+        chunk = list(
+            users.filter(id__gt=last_id).order_by('id').only('id', 'created_at', 'rates_count', 'total_rates_weight')
+            [:chunk_size]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        for user in chunk:
+            user.rate_weight = user.get_rate_weight()
+        User.objects.bulk_update(chunk, ['rate_weight'])
@@ -1,2 +1,4 @@
 from .test_models import *
-from .test_views import *
\ No newline at end of file
+from .test_views import *
+from .test_tasks import *
+from .test_authentication import *
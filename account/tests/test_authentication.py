@@ -0,0 +1,60 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from account.authentication import CachedUserJWTAuthentication
+from account.models import get_user_cache_key
+
+User = get_user_model()
+
+
+@pytest.mark.django_db
+class TestCachedUserJWTAuthentication:
+    def setup_method(self):
+        self.user = User.objects.create_user(username='test_user', password='password')
+        self.authentication = CachedUserJWTAuthentication()
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        return self.authentication.authenticate(request)[0]
+
+    def test_cached_user(self, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            user = self.authenticate()
+        with django_assert_num_queries(0):
+            cached_user = self.authenticate()
+        assert user == cached_user == self.user
+        assert cached_user.username == 'test_user'
+
+    def test_password_hash_is_not_cached(self):
+        self.authenticate()
+        cached_user = cache.get(get_user_cache_key(self.user.id))
+        assert set(cached_user) == {'id', 'is_active', 'password_hash'}
+        assert self.user.password not in cached_user.values()
+
+    def test_queryset_deactivation_after_timeout(self):
+        self.authenticate()
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.authenticate()  # the cached user is used until it expires
+        cache.delete(get_user_cache_key(self.user.id))
+        with pytest.raises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_invalidated_on_save(self):
+        self.authenticate()
+        self.user.first_name = 'Test'
+        self.user.save()
+        assert self.authenticate().first_name == 'Test'
+        self.user.is_active = False
+        self.user.save()
+        with pytest.raises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_invalidated_on_delete(self):
+        self.authenticate()
+        User.objects.get(id=self.user.id).delete()
+        with pytest.raises(AuthenticationFailed):
+            self.authenticate()
@@ -0,0 +1,36 @@
+import pytest
+from django.utils import timezone
+from account.models import User
+from account.tasks import calculate_users_rate_weight, user_rate_weight
+from blog.models import Post, Rate
+
+
+@pytest.mark.django_db
+class TestUserRateWeightTask:
+
+    def setup_method(self):
+        self.posts = [Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(5)]
+        self.users = [User.objects.create(username=f'user{i}', password='password') for i in range(5)]
+        User.objects.filter(id__in=[user.id for user in self.users]).update(
+            created_at=timezone.now() - timezone.timedelta(days=40), total_rates_weight=2
+        )
+        for user in self.users:
+            for post in self.posts:
+                Rate.objects.create(post=post, user=user, score=3)
+        self.inactive_user = User.objects.create(username='inactive_user', password='password', rate_weight=0.3)
+
+    def test_user_rate_weight(self):
+        user_rate_weight()
+        for user in self.users:
+            user.refresh_from_db()
+            expected_user = User.objects.get(id=user.id)
+            expected_user.calculate_rate_weight()
+            assert user.rate_weight == expected_user.rate_weight
+            assert user.rate_weight == round((0.2 + 0.4) / 2, 3)
+        self.inactive_user.refresh_from_db()
+        assert self.inactive_user.rate_weight == 0.3
+
+    def test_user_rate_weight_num_queries(self, django_assert_num_queries):
+        # each chunk of 2 users (not each rate) is selected and updated with one query, and the last empty chunk
+        with django_assert_num_queries(3 * 2 + 1):
+            calculate_users_rate_weight(User.objects.filter(rates__isnull=False).distinct(), chunk_size=2)
@@ -1,12 +1,25 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenObtainPairView
+from core.throttling import AnonRedisRateThrottle
 from .serializers import UserSerializer
 
 
+class SignUpThrottle(AnonRedisRateThrottle):
+    scope = 'signup'
+    rate = '20/hour'
+
+
+class LoginThrottle(AnonRedisRateThrottle):
+    scope = 'login'
+    rate = '10/min'
+
+
 class SignUpView(APIView):
     authentication_classes = []
     permission_classes = []
+    throttle_classes = (SignUpThrottle, )
 
     def post(self, request):
         """
@@ -17,3 +30,7 @@ class SignUpView(APIView):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class LoginView(TokenObtainPairView):
+    throttle_classes = (LoginThrottle, )
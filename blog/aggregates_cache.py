@@ -0,0 +1,200 @@
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from core.async_redis import cache_aget_many, cache_aset_many
+from core.local_cache import LocalCache
+from .models import Post
+
+AGGREGATES_CACHE_TIMEOUT = 5 * 60  # cache the values for 5 minutes
+AGGREGATES_INVALIDATION_CHANNEL = 'POST_AGGREGATES_INVALIDATION'
+
+# first tier of the aggregates cache in each process, in front of redis
+local_cache = LocalCache(
+    timeout=settings.POST_AGGREGATES_LOCAL_CACHE_TIMEOUT,
+    max_size=settings.POST_AGGREGATES_LOCAL_CACHE_SIZE,
+)
+redis_cache_stats = {'hits': 0, 'misses': 0}
+
+_invalidation_listener = None
+_invalidation_listener_lock = threading.Lock()
+
+# fields of the aggregates, the only fields of the posts loaded for missed values
+AGGREGATES_FIELDS = ['id', 'rates_count', 'total_rates_sum', 'weighted_total_rates_sum', 'weighted_rates_count']
+
+# None and 0 are valid aggregates of a post, a stored None is not returned by get_many so it's stored as this value
+CACHED_NONE = 'NONE'
+
+
+def get_average_rate_cache_key(post_id):
+    return f'AVERAGE_RATE_{post_id}_POST'
+
+
+def get_rates_count_cache_key(post_id):
+    return f'RATES_COUNT_{post_id}_POST'
+
+
+def get_posts_aggregates(post_ids, posts=None):
+    """
+    Get {post_id: {'average_rate': ..., 'rate_counts': ...}} of given posts from the local cache,
+    the values missed in local cache are read from redis with one get_many.
+    Missed values are calculated from given {post_id: post} (or their fields loaded with one in_bulk) and cached
+    with one set_many, a post can be a .values() row of the post too
+    """
+    start_invalidation_listener()
+    keys = get_posts_aggregates_keys(post_ids)
+    cached_values = local_cache.get_many(keys.keys())
+    redis_keys = [key for key in keys if key not in cached_values]
+    if redis_keys:
+        cached_values.update(cache_redis_values(redis_keys, cache.get_many(redis_keys)))
+
+    missed_post_ids = {post_id for key, (post_id, field) in keys.items() if key not in cached_values}
+    if missed_post_ids and posts is None:
+        posts = Post.objects.only(*AGGREGATES_FIELDS).in_bulk(missed_post_ids)
+
+    posts_aggregates, missed_values = build_posts_aggregates(post_ids, keys, cached_values, posts)
+    if missed_values:
+        cache.set_many(missed_values, AGGREGATES_CACHE_TIMEOUT)
+        local_cache.set_many(missed_values)
+    return posts_aggregates
+
+
+async def aget_posts_aggregates(post_ids, posts=None):
+    """
+    Async get_posts_aggregates, redis is read and written with the async client
+    """
+    start_invalidation_listener()
+    keys = get_posts_aggregates_keys(post_ids)
+    cached_values = local_cache.get_many(keys.keys())
+    redis_keys = [key for key in keys if key not in cached_values]
+    if redis_keys:
+        cached_values.update(cache_redis_values(redis_keys, await cache_aget_many(redis_keys)))
+
+    missed_post_ids = {post_id for key, (post_id, field) in keys.items() if key not in cached_values}
+    if missed_post_ids and posts is None:
+        posts = await Post.objects.only(*AGGREGATES_FIELDS).ain_bulk(missed_post_ids)
+
+    posts_aggregates, missed_values = build_posts_aggregates(post_ids, keys, cached_values, posts)
+    if missed_values:
+        await cache_aset_many(missed_values, AGGREGATES_CACHE_TIMEOUT)
+        local_cache.set_many(missed_values)
+    return posts_aggregates
+
+
+def get_posts_aggregates_keys(post_ids):
+    """
+    Get {cache key: (post_id, field)} of the aggregates of given posts
+    """
+    keys = {}
+    for post_id in post_ids:
+        keys[get_average_rate_cache_key(post_id)] = (post_id, 'average_rate')
+        keys[get_rates_count_cache_key(post_id)] = (post_id, 'rate_counts')
+    return keys
+
+
+def cache_redis_values(redis_keys, redis_values):
+    """
+    Count hits and misses of the values read from redis and keep them in the local cache
+    """
+    redis_cache_stats['hits'] += len(redis_values)
+    redis_cache_stats['misses'] += len(redis_keys) - len(redis_values)
+    local_cache.set_many(redis_values)
+    return redis_values
+
+
+def build_posts_aggregates(post_ids, keys, cached_values, posts):
+    """
+    Get aggregates of given posts from the cached values, or from the posts for missed values.
+    Returns the aggregates of existing posts and {key: value} of the missed values to be cached
+    """
+    posts_aggregates = {post_id: {} for post_id in post_ids}
+    missed_values = {}
+    deleted_post_ids = set()
+    for key, (post_id, field) in keys.items():
+        if key in cached_values:
+            value = cached_values[key]
+            posts_aggregates[post_id][field] = None if value == CACHED_NONE else value
+            continue
+        post = posts.get(post_id)
+        if post is None:  # post does not exist
+            deleted_post_ids.add(post_id)
+            continue
+        value = get_post_aggregate(post, field)
+        posts_aggregates[post_id][field] = value
+        missed_values[key] = CACHED_NONE if value is None else value
+
+    for post_id in deleted_post_ids:
+        posts_aggregates.pop(post_id)
+    return posts_aggregates, missed_values
+
+
+def get_post_aggregate(post, field):
+    """
+    Value of an aggregate field of a post instance or a .values() row of the post
+    """
+    if isinstance(post, dict):
+        if field == 'average_rate':
+            return Post.calculate_weighted_average_rate(post['weighted_total_rates_sum'], post['weighted_rates_count'])
+        return post['rates_count']
+    return post.weighted_average_rate if field == 'average_rate' else post.rates_count
+
+
+def invalidate_posts_aggregates(post_ids):
+    """
+    Remove cached aggregates of given posts while their rates or weights are changed,
+    local caches of other processes are invalidated through redis pub/sub
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    keys = [get_rates_count_cache_key(post_id) for post_id in post_ids] + \
+        [get_average_rate_cache_key(post_id) for post_id in post_ids]
+    cache.delete_many(keys)
+    local_cache.delete_many(keys)
+    get_redis_connection('default').publish(AGGREGATES_INVALIDATION_CHANNEL, json.dumps(post_ids))
+
+
+def get_aggregates_cache_stats():
+    """
+    Hit and miss counts of each tier of the aggregates cache in current process, to size the local cache
+    """
+    return {
+        'local': {'hits': local_cache.hits, 'misses': local_cache.misses, 'size': len(local_cache)},
+        'redis': dict(redis_cache_stats),
+    }
+
+
+def start_invalidation_listener():
+    """
+    Start a daemon thread in current process which removes the invalidated posts from local cache
+    """
+    global _invalidation_listener
+    if _invalidation_listener is not None or not local_cache.timeout:
+        return
+    with _invalidation_listener_lock:
+        if _invalidation_listener is None:
+            _invalidation_listener = threading.Thread(target=listen_invalidations, daemon=True)
+            _invalidation_listener.start()
+
+
+def listen_invalidations():
+    while True:
+        try:
+            pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(AGGREGATES_INVALIDATION_CHANNEL)
+            # invalidations published while the listener was disconnected are missed
+            local_cache.clear()
+            for message in pubsub.listen():
+                post_ids = json.loads(message['data'])
+                local_cache.delete_many(
+                    [get_rates_count_cache_key(post_id) for post_id in post_ids] +
+                    [get_average_rate_cache_key(post_id) for post_id in post_ids]
+                )
+        except Exception:
+            logging.exception('Post aggregates invalidation listener is disconnected')
+            time.sleep(1)
@@ -0,0 +1,63 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = 'Send concurrent requests to the sync and async post list views of a running server and compare them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000', help='Url of the running server')
+        parser.add_argument('--concurrency', type=int, default=100, help='Number of requests sent at the same time')
+        parser.add_argument('--requests', type=int, default=2000, help='Number of requests sent to each view')
+        parser.add_argument(
+            '--token', default=None,
+            help='Access token of the requests, pages of anonymous users are served from the page cache',
+        )
+        parser.add_argument('--ordering', default='latest', help='Ordering of the post list')
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': f'Bearer {options["token"]}'} if options['token'] else {}
+        for name, url_name in (('sync', 'post_list'), ('async', 'async_post_list')):
+            url = f'{options["base_url"].rstrip("/")}{reverse(url_name)}?ordering={options["ordering"]}'
+            result = self.run_load(url, headers, options['concurrency'], options['requests'])
+            self.stdout.write(
+                f'{name:<6} {result["requests_per_second"]:8.1f} req/s  '
+                f'p50 {result["p50"]:7.1f} ms  p95 {result["p95"]:7.1f} ms  p99 {result["p99"]:7.1f} ms  '
+                f'errors {result["errors"]}'
+            )
+
+    def run_load(self, url, headers, concurrency, requests_count):
+        """
+        Send requests_count requests to url from concurrency threads, get throughput and latency percentiles
+        """
+        def send_request(_):
+            request = urllib.request.Request(url, headers=headers)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(send_request, range(requests_count)))
+        duration = time.perf_counter() - start
+
+        latencies = sorted(latency for ok, latency in results if ok)
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+        return {
+            'requests_per_second': len(latencies) / duration,
+            'p50': percentiles[49],
+            'p95': percentiles[94],
+            'p99': percentiles[98],
+            'errors': len(results) - len(latencies),
+        }
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.partitions import create_rate_partition, detach_rate_partitions, get_month_start, get_rate_partition_name
+
+
+class Command(BaseCommand):
+    help = 'Create monthly partitions of rates ahead of time and detach the partitions of old rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int, default=3,
+            help='Create partitions of current month and this number of next months',
+        )
+        parser.add_argument(
+            '--detach-older-than', type=int, default=None,
+            help='Detach partitions of rates created before this number of months ago',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        for months in range(options['months_ahead'] + 1):
+            month_start = get_month_start(now, months=months)
+            if create_rate_partition(month_start):
+                self.stdout.write(f'Created {get_rate_partition_name(month_start)}')
+
+        if options['detach_older_than'] is not None:
+            for name in detach_rate_partitions(get_month_start(now, months=-options['detach_older_than'])):
+                self.stdout.write(f'Detached {name}')
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_userweightdelta'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rate',
+            index=models.Index(condition=models.Q(('weight__isnull', True)), fields=['id'], name='blog_rate_pending_idx'),
+        ),
+    ]
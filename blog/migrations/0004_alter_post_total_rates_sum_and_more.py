@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_rate_blog_rate_pending_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='total_rates_sum',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='total_rates_sum_squared',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:02
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, NullIf, Round
+
+
+def set_top_rate(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Post.objects.filter(weighted_rates_count__gt=0).update(top_rate=Coalesce(
+        Round(F('weighted_total_rates_sum') / NullIf(F('weighted_rates_count'), Value(0.0)), 3),
+        Value(0.0),
+        output_field=models.FloatField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_alter_post_total_rates_sum_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='top_rate',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='trending_rate',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(set_top_rate, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-top_rate', '-id'], name='blog_post_top_rate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending_rate', '-id'], name='blog_post_trending_rate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rate',
+            index=models.Index(fields=['created_at', 'post'], name='blog_rate_created_post_idx'),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+RATE_COLUMNS = 'id, created_at, updated_at, is_active, score, weight, is_outlier, post_id, user_id'
+
+RATE_COLUMNS_DEFINITION = """
+    "created_at" timestamp with time zone NOT NULL,
+    "updated_at" timestamp with time zone NOT NULL,
+    "is_active" boolean NOT NULL,
+    "score" integer NOT NULL CHECK ("score" >= 0),
+    "weight" double precision NULL,
+    "is_outlier" boolean NOT NULL,
+    "post_id" bigint NOT NULL,
+    "user_id" bigint NOT NULL
+"""
+
+# foreign keys and indexes of the rate table in migration state, created again on the new table
+RATE_CONSTRAINTS_AND_INDEXES = """
+ALTER TABLE "blog_rate" ADD CONSTRAINT "blog_rate_post_id_8fe5d47f_fk_blog_post_id"
+    FOREIGN KEY ("post_id") REFERENCES "blog_post" ("id") DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE "blog_rate" ADD CONSTRAINT "blog_rate_user_id_f374297f_fk_account_user_id"
+    FOREIGN KEY ("user_id") REFERENCES "account_user" ("id") DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX "blog_rate_post_id_8fe5d47f" ON "blog_rate" ("post_id");
+CREATE INDEX "blog_rate_user_id_f374297f" ON "blog_rate" ("user_id");
+CREATE INDEX "blog_rate_post_id_b111ce_idx" ON "blog_rate" ("post_id");
+CREATE INDEX "blog_rate_user_id_45e987_idx" ON "blog_rate" ("user_id");
+CREATE INDEX "blog_rate_pending_idx" ON "blog_rate" ("id") WHERE "weight" IS NULL;
+CREATE INDEX "blog_rate_created_post_idx" ON "blog_rate" ("created_at", "post_id");
+"""
+
+# Partition the rate table by created_at. Rates are copied to a partitioned table with one default partition,
+# monthly partitions are created by rate_partitions command which moves their rates out of the default partition.
+# Unique (post, user) of rates is kept in blog_ratekey by statement triggers of the rate table
+PARTITION_RATE_SQL = f"""
+ALTER TABLE "blog_rate" RENAME TO "blog_rate_unpartitioned";
+CREATE TABLE "blog_rate" (
+    "id" bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+    {RATE_COLUMNS_DEFINITION},
+    PRIMARY KEY ("id", "created_at")
+) PARTITION BY RANGE ("created_at");
+CREATE TABLE "blog_rate_default" PARTITION OF "blog_rate" DEFAULT;
+INSERT INTO "blog_rate" ({RATE_COLUMNS}) SELECT {RATE_COLUMNS} FROM "blog_rate_unpartitioned";
+SELECT setval(pg_get_serial_sequence('"blog_rate"', 'id'), COALESCE(MAX("id"), 0) + 1, false) FROM "blog_rate";
+INSERT INTO "blog_ratekey" ("post_id", "user_id") SELECT "post_id", "user_id" FROM "blog_rate";
+DROP TABLE "blog_rate_unpartitioned";
+{RATE_CONSTRAINTS_AND_INDEXES}
+
+CREATE FUNCTION "blog_rate_insert_keys"() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "blog_ratekey" ("post_id", "user_id") SELECT "post_id", "user_id" FROM "new_rates";
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+CREATE FUNCTION "blog_rate_delete_keys"() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM "blog_ratekey" USING "old_rates"
+    WHERE "blog_ratekey"."post_id" = "old_rates"."post_id" AND "blog_ratekey"."user_id" = "old_rates"."user_id";
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER "blog_rate_insert_keys" AFTER INSERT ON "blog_rate"
+    REFERENCING NEW TABLE AS "new_rates" FOR EACH STATEMENT EXECUTE FUNCTION "blog_rate_insert_keys"();
+CREATE TRIGGER "blog_rate_delete_keys" AFTER DELETE ON "blog_rate"
+    REFERENCING OLD TABLE AS "old_rates" FOR EACH STATEMENT EXECUTE FUNCTION "blog_rate_delete_keys"();
+"""
+
+UNPARTITION_RATE_SQL = f"""
+DROP TRIGGER "blog_rate_insert_keys" ON "blog_rate";
+DROP TRIGGER "blog_rate_delete_keys" ON "blog_rate";
+DROP FUNCTION "blog_rate_insert_keys"();
+DROP FUNCTION "blog_rate_delete_keys"();
+ALTER TABLE "blog_rate" RENAME TO "blog_rate_partitioned";
+CREATE TABLE "blog_rate" (
+    "id" bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    {RATE_COLUMNS_DEFINITION}
+);
+INSERT INTO "blog_rate" ({RATE_COLUMNS}) SELECT {RATE_COLUMNS} FROM "blog_rate_partitioned";
+SELECT setval(pg_get_serial_sequence('"blog_rate"', 'id'), COALESCE(MAX("id"), 0) + 1, false) FROM "blog_rate";
+DROP TABLE "blog_rate_partitioned" CASCADE;
+{RATE_CONSTRAINTS_AND_INDEXES}
+ALTER TABLE "blog_rate" ADD CONSTRAINT "blog_rate_post_id_user_id_3cabb96f_uniq" UNIQUE ("post_id", "user_id");
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_leaderboard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('post', 'user')},
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterUniqueTogether(
+                    name='rate',
+                    unique_together=set(),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(PARTITION_RATE_SQL, UNPARTITION_RATE_SQL),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_partition_rate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='rate',
+            name='blog_rate_post_id_b111ce_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='rate',
+            name='blog_rate_user_id_45e987_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='rate',
+            name='blog_rate_created_post_idx',
+        ),
+        migrations.AlterField(
+            model_name='rate',
+            name='post',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='blog.post'),
+        ),
+        migrations.AlterField(
+            model_name='rate',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rates', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='blog_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rate',
+            index=models.Index(fields=['user', 'post'], include=('score', 'weight'), name='blog_rate_user_post_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rate',
+            index=models.Index(fields=['post', 'created_at'], name='blog_rate_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rate',
+            index=models.Index(fields=['created_at'], include=('post', 'user'), name='blog_rate_created_idx'),
+        ),
+    ]
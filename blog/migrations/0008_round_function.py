@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# round(value, digits) of python for the sql weighting engine. ROUND of postgres rounds half away from zero
+# on the 15 digits numeric of a float, python rounds the exact binary value of the float and rounds exact ties
+# to even, so e.g. 0.009 / 2 is 0.004 in python and 0.005 with ROUND.
+# value * 2 ^ shift is an integer below 2 ^ 62, so value is exactly its bigint / 2 ^ shift and it's rounded
+# with exact numeric integers
+CREATE_ROUND_FUNCTION_SQL = """
+CREATE FUNCTION "blog_round"(value double precision, digits integer) RETURNS double precision AS $$
+DECLARE
+    shift integer;
+    numerator numeric;
+    denominator numeric;
+    rounded numeric;
+    remainder numeric;
+BEGIN
+    IF value = 0 OR value IN ('NaN', 'Infinity', '-Infinity') THEN
+        RETURN value;
+    END IF;
+    shift := 60 - floor(log(2, abs(value)::numeric))::integer;
+    numerator := (value * 2::double precision ^ shift)::bigint * 10::numeric ^ digits;
+    denominator := 2::numeric ^ shift;
+    rounded := div(numerator, denominator);
+    remainder := abs(numerator - rounded * denominator) * 2;
+    IF remainder > denominator OR (remainder = denominator AND mod(rounded, 2) <> 0) THEN
+        rounded := rounded + sign(value);
+    END IF;
+    RETURN (rounded / 10::numeric ^ digits)::double precision;
+END
+$$ LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE;
+"""
+
+DROP_ROUND_FUNCTION_SQL = 'DROP FUNCTION "blog_round"(double precision, integer);'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_ROUND_FUNCTION_SQL, DROP_ROUND_FUNCTION_SQL),
+    ]
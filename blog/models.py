@@ -1,12 +1,16 @@
+import math
+
 from django.utils import timezone
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
-from django.db import models
-from django.db.models import F
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, NullIf, Round
 
 from account.models import User
 from core.models import BaseModel
+from .response_cache import bump_post_list_generation
 
 
 class Post(BaseModel):
@@ -15,21 +19,64 @@ class Post(BaseModel):
     weighted_total_rates_sum = models.FloatField(default=0, validators=[MinValueValidator(0)])
     weighted_rates_count = models.FloatField(default=0, validators=[MinValueValidator(0)])
     rates_count = models.PositiveIntegerField(default=0)
-    total_rates_sum = models.PositiveIntegerField(default=0)
-    total_rates_sum_squared = models.PositiveIntegerField(default=0)  # Sum of squares of rates
+    # 64-bit sums of scores and squared scores keep the exact moments of hundreds of millions of rates
+    total_rates_sum = models.PositiveBigIntegerField(default=0)
+    total_rates_sum_squared = models.PositiveBigIntegerField(default=0)  # Sum of squares of rates
     average_rating_speed = models.FloatField(default=0, validators=[MinValueValidator(0)])
+    # materialized weighted_average_rate (0 if not rated) and rates count of last 5 hours, to page the leaderboards
+    # through their indexes
+    top_rate = models.FloatField(default=0)
+    trending_rate = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-top_rate', '-id'], name='blog_post_top_rate_idx'),
+            models.Index(fields=['-trending_rate', '-id'], name='blog_post_trending_rate_idx'),
+            # latest posts of PostView
+            models.Index(fields=['-created_at', '-id'], name='blog_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if kwargs.get('update_fields') is None:  # a new or edited post is shown in the cached post list pages
+            bump_post_list_generation()
+
+    def delete(self, *args, **kwargs):
+        # aggregates_cache imports the models
+        from .aggregates_cache import invalidate_posts_aggregates
+
+        post_id = self.id
+        result = super().delete(*args, **kwargs)
+        invalidate_posts_aggregates([post_id])  # a deleted post is skipped by the stats instead of its cached values
+        bump_post_list_generation()
+        return result
+
+    @staticmethod
+    def get_top_rate_expression(weighted_total_rates_sum, weighted_rates_count):
+        """
+        Expression of weighted_average_rate from given expressions of the weighted sums, to update top_rate
+        in the same query which changes the weighted sums
+        """
+        return Coalesce(
+            Round(weighted_total_rates_sum / NullIf(weighted_rates_count, Value(0.0)), 3),
+            Value(0.0),
+            output_field=models.FloatField(),
+        )
+
     def update_statistics(self, rate):
         """
         Method to increase basic statistic of post
         """
-        self.rates_count += 1
-        self.total_rates_sum += rate
-        self.total_rates_sum_squared += rate ** 2
-        self.save()
+        # F() expressions keep the counters exact while many rates of the same post are submitted concurrently
+        Post.objects.filter(id=self.id).update(
+            rates_count=F('rates_count') + 1,
+            total_rates_sum=F('total_rates_sum') + rate,
+            total_rates_sum_squared=F('total_rates_sum_squared') + rate ** 2,
+        )
+        self.refresh_from_db(fields=['rates_count', 'total_rates_sum', 'total_rates_sum_squared'])
 
     @property
     def normal_average_rate(self):
@@ -37,13 +84,23 @@ class Post(BaseModel):
             return round(self.total_rates_sum / self.rates_count, 3)
         return None
 
+    @property
+    def variance(self):
+        """
+        Population variance of scores, (n * sum_sq - sum²) / n² is calculated with exact integers
+        and divided once, so it never loses precision or gets negative for any number of rates
+        """
+        if self.rates_count == 0:
+            return None
+        return (
+            (self.rates_count * self.total_rates_sum_squared - self.total_rates_sum ** 2) / self.rates_count ** 2
+        )
+
     @property
     def standard_deviation(self):
         if self.rates_count == 0:
             return None
-        avg = self.normal_average_rate
-        variance = (self.total_rates_sum_squared / self.rates_count) - (avg ** 2)
-        return round(variance ** 0.5, 3)
+        return round(math.sqrt(self.variance), 3)
 
     def calculate_average_rating_speed(self):
         """
@@ -59,7 +116,7 @@ class Post(BaseModel):
         else:
             avg_speed = rate_count
         self.average_rating_speed = avg_speed
-        self.save()
+        self.save(update_fields=['average_rating_speed', 'updated_at'])  # don't overwrite counters of the post
 
     def get_rating_speed_weight(self, recent_rates_count):
         """
@@ -72,49 +129,81 @@ class Post(BaseModel):
         """
         Calculate weighted average rate based on weighted_total_rates_sum and weighted_rates_count
         """
-        if self.weighted_rates_count and self.weighted_total_rates_sum:
-            return round(self.weighted_total_rates_sum / self.weighted_rates_count, 3)
+        return self.calculate_weighted_average_rate(self.weighted_total_rates_sum, self.weighted_rates_count)
+
+    @staticmethod
+    def calculate_weighted_average_rate(weighted_total_rates_sum, weighted_rates_count):
+        if weighted_rates_count and weighted_total_rates_sum:
+            return round(weighted_total_rates_sum / weighted_rates_count, 3)
         else:
             return None
 
 
 class Rate(BaseModel):
-    post = models.ForeignKey(Post, related_name='rates', on_delete=models.CASCADE)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='rates', on_delete=models.CASCADE)
+    # foreign keys are covered by the composite indexes of Meta
+    post = models.ForeignKey(Post, related_name='rates', on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='rates', on_delete=models.CASCADE, db_index=False)
     score = models.PositiveIntegerField(validators=[MaxValueValidator(5)])
     weight = models.FloatField(validators=[MinValueValidator(0), MaxValueValidator(1)], null=True, blank=True)
     is_outlier = models.BooleanField(default=False)
 
+    # About 68% of the data falls within three standard deviations
+    # About 95% of the data falls within two standard deviations
+    # About 99.7% of the data falls within one standard deviation (we use this)
+    STANDARD_DEVIATION_RATIO = 1
+
+    # at least 1000 Statistical rates needed to find outlier rates
+    MIN_TOTAL_RATES_REQUIRED = 1000
+
+    RATING_SPEED_WEIGHT_RATIO = 1
+    USER_WEIGHT_RATIO = 2
+
     class Meta:
-        unique_together = ('post', 'user')
+        # Rate table is partitioned by created_at in postgres, unique (post, user) is kept by RateKey
         indexes = [
-            models.Index(fields=['post']),
-            models.Index(fields=['user']),
+            # rate of a user on given posts (user's rates of a page, update_or_create) without reading the table
+            models.Index(fields=['user', 'post'], include=['score', 'weight'], name='blog_rate_user_post_idx'),
+            # rates of given posts created since a time (recent rates count, rates of a deleted post)
+            models.Index(fields=['post', 'created_at'], name='blog_rate_post_created_idx'),
+            # posts and users of rates created since a time for the periodic tasks, without reading the table
+            models.Index(fields=['created_at'], include=['post', 'user'], name='blog_rate_created_idx'),
+            # pending rates of weighting task, weighted rates leave the index
+            models.Index(fields=['id'], condition=models.Q(weight__isnull=True), name='blog_rate_pending_idx'),
         ]
 
     def __str__(self):
         return f'{self.post}| {self.user}| {self.score}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        keep the loaded score to find the score change while updating instance without another query
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_score = instance.__dict__.get('score')
+        return instance
+
     def get_is_outlier(self, post_standard_deviation=None, post_average_rate=None, post_rates_count=None):
         """
         If total rates count of the post passes min_total_rates_required
-        Checks if the rate is outlier based on post_standard_deviation and post_average_rate
+        Checks if the rate is outlier based on post_standard_deviation and post_average_rate.
+        If the moments are not passed they're read from self.post, which is a query unless the post is preloaded
+        (e.g. with select_related), so callers of many rates should pass the moments or preload their posts
         """
-        # About 68% of the data falls within three standard deviations
-        # About 95% of the data falls within two standard deviations
-        # About 99.7% of the data falls within one standard deviation (we use this)
-        standard_deviation_ratio = 1
-
-        # at least 1000 Statistical rates needed to find outlier rates
-        min_total_rates_required = 1000
+        standard_deviation_ratio = self.STANDARD_DEVIATION_RATIO
+        min_total_rates_required = self.MIN_TOTAL_RATES_REQUIRED
 
-        if not (post_standard_deviation and post_average_rate and post_rates_count):
-            post = Post.objects.get(id=self.post_id)
+        # a post without deviation (all scores are equal) is passed as 0, so only missing values are read from
+        # the moments of the related post instance
+        if post_rates_count is None:
+            post = self.post
             post_standard_deviation = post.standard_deviation
             post_average_rate = post.normal_average_rate
             post_rates_count = post.rates_count
         if post_rates_count < min_total_rates_required:
             return False
+        if post_standard_deviation is None or post_average_rate is None:
+            return False
         min_value = post_average_rate - (standard_deviation_ratio * post_standard_deviation)
         max_value = post_average_rate + (standard_deviation_ratio * post_standard_deviation)
         if min_value <= self.score <= max_value:
@@ -133,8 +222,8 @@ class Rate(BaseModel):
         """
         if is_outlier:
             return 0
-        rating_speed_weight_ratio = 1
-        user_weight_ratio = 2
+        rating_speed_weight_ratio = Rate.RATING_SPEED_WEIGHT_RATIO
+        user_weight_ratio = Rate.USER_WEIGHT_RATIO
         weight = (
                 (
                         (rating_speed_weight_ratio * post_rating_speed_weight)
@@ -149,18 +238,68 @@ class Rate(BaseModel):
         """
         override save method to handle some changes in adding and updating state on instance
         """
-        if self._state.adding:
-            # update basic statistics of the related post and user in adding state of instance
-            User.objects.get(id=self.user_id).increase_rates_count()
-            Post.objects.get(id=self.post_id).update_statistics(self.score)
-        else:
-            # if rate has weight while updating score, rates has affected the average rate of post,
-            # so changing the score will change the weighted_total_rates_sum directly with the same weight
-            if self.weight:
-                pre_rate_score = Rate.objects.get(id=self.id).score
+        # counters of the related post and user are changed with atomic F() updates in the same transaction
+        with transaction.atomic(savepoint=False):
+            if self._state.adding:
+                # update basic statistics of the related post and user in adding state of instance
+                User.objects.filter(id=self.user_id).update(rates_count=F('rates_count') + 1)
+                Post.objects.filter(id=self.post_id).update(
+                    rates_count=F('rates_count') + 1,
+                    total_rates_sum=F('total_rates_sum') + self.score,
+                    total_rates_sum_squared=F('total_rates_sum_squared') + self.score ** 2,
+                )
+            else:
+                pre_rate_score = getattr(self, '_loaded_score', None)
+                if pre_rate_score is None:
+                    pre_rate_score = Rate.objects.get(id=self.id).score
                 if self.score != pre_rate_score:
-                    Post.objects.filter(id=self.post_id).update(
-                        weighted_total_rates_sum=F('weighted_total_rates_sum') - (pre_rate_score * self.weight) + (
-                                    self.score * self.weight),
-                    )
-        super().save(*args, **kwargs)
+                    post_updates = {
+                        'total_rates_sum': F('total_rates_sum') + (self.score - pre_rate_score),
+                        'total_rates_sum_squared': (
+                            F('total_rates_sum_squared') + (self.score ** 2 - pre_rate_score ** 2)
+                        ),
+                    }
+                    # if rate has weight while updating score, rates has affected the average rate of post,
+                    # so changing the score will change the weighted_total_rates_sum directly with the same weight
+                    if self.weight:
+                        post_updates['weighted_total_rates_sum'] = (
+                            F('weighted_total_rates_sum') - (pre_rate_score * self.weight) + (self.score * self.weight)
+                        )
+                        post_updates['top_rate'] = Post.get_top_rate_expression(
+                            post_updates['weighted_total_rates_sum'], F('weighted_rates_count'),
+                        )
+                    Post.objects.filter(id=self.post_id).update(**post_updates)
+                    if self.weight:  # top_rate and average_rate of the post are changed
+                        bump_post_list_generation()
+            super().save(*args, **kwargs)
+        self._loaded_score = self.score
+
+
+class RateKey(models.Model):
+    """
+    Unique (post, user) of rates. Rate table is partitioned by created_at and a unique constraint of a partitioned
+    table must include the partition key, so the (post, user) of each rate is kept in this table.
+    Rows are inserted and deleted by the statement triggers of the rate table, so a duplicate rate fails with
+    IntegrityError like a unique constraint, and update_or_create and bulk_create of rates work the same
+    """
+    post = models.ForeignKey(Post, related_name='+', on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('post', 'user')
+
+    def __str__(self):
+        return f'{self.post_id}| {self.user_id}'
+
+
+class UserWeightDelta(BaseModel):
+    """
+    Weight of rates weighted by a shard of the sharded weighting task, the callback of the shards adds it to
+    user's total_rates_weight. It's saved in the transaction of the weighted rates, so a retried shard or callback
+    never loses or double counts a weight
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='weight_deltas', on_delete=models.CASCADE)
+    weight = models.FloatField()
+
+    def __str__(self):
+        return f'{self.user}| {self.weight}'
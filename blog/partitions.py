@@ -0,0 +1,87 @@
+import datetime
+import re
+
+from django.db import connection, transaction
+
+from .models import Rate
+
+RATE_TABLE = Rate._meta.db_table
+RATE_DEFAULT_PARTITION = f'{RATE_TABLE}_default'
+RATE_PARTITION_NAME_PATTERN = re.compile(rf'^{RATE_TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def get_month_start(date, months=0):
+    """
+    First moment (UTC) of the month of given date, moved by given number of months
+    """
+    month_index = date.year * 12 + date.month - 1 + months
+    return datetime.datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def get_rate_partition_name(month_start):
+    return f'{RATE_TABLE}_p{month_start:%Y%m}'
+
+
+def get_rate_partitions():
+    """
+    Get {month_start: partition name} of the monthly partitions attached to the rate table
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.relname = %s',
+            [RATE_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = RATE_PARTITION_NAME_PATTERN.match(name)
+        if match:
+            partitions[datetime.datetime(int(match[1]), int(match[2]), 1, tzinfo=datetime.timezone.utc)] = name
+    return partitions
+
+
+def create_rate_partition(month_start):
+    """
+    Create the partition of rates created in the month of month_start, return False if it already exists.
+    Rates of the month which are in the default partition are moved to the new partition in the same transaction,
+    rows are moved in the partitions directly so the rate keys are not changed by the triggers of the rate table
+    """
+    if month_start in get_rate_partitions():
+        return False
+    name = get_rate_partition_name(month_start)
+    month_end = get_month_start(month_start, months=1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE "{RATE_DEFAULT_PARTITION}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{RATE_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved_rates AS ('
+            f'DELETE FROM "{RATE_DEFAULT_PARTITION}" WHERE created_at >= %s AND created_at < %s RETURNING *'
+            f') INSERT INTO "{name}" SELECT * FROM moved_rates',
+            [month_start, month_end],
+        )
+        cursor.execute(
+            f'ALTER TABLE "{RATE_TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            [month_start, month_end],
+        )
+    return True
+
+
+def detach_rate_partitions(before):
+    """
+    Detach the partitions of rates created before the month of given date and return their names.
+    Detached tables are kept to be archived. The keys of their rates are kept in RateKey, because the counters
+    and weighted sums of the posts and users still include the detached rates, so a user can't rate
+    the same post twice
+    """
+    detached = []
+    before = get_month_start(before)
+    for month_start, name in sorted(get_rate_partitions().items()):
+        if month_start >= before:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{RATE_TABLE}" DETACH PARTITION "{name}"')
+        detached.append(name)
+    return detached
@@ -0,0 +1,266 @@
+import json
+import operator
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import LockNotOwnedError
+
+from account.models import User
+from core.async_redis import get_async_redis_connection
+from .aggregates_cache import invalidate_posts_aggregates
+from .models import Post, Rate
+from .rating_velocity import record_new_rates
+from .response_cache import bump_post_list_generation
+
+RATE_BUFFER_KEY = 'RATE_BUFFER'
+RATE_BUFFER_PROCESSING_KEY = 'RATE_BUFFER_PROCESSING'
+# buffered rates which can't be written, e.g. rates of detached partitions, kept to be inspected
+RATE_BUFFER_DEAD_LETTER_KEY = 'RATE_BUFFER_DEAD_LETTER'
+RATE_BUFFER_LOCK_KEY = 'RATE_BUFFER_LOCK'
+RATE_BUFFER_LOCK_TIMEOUT = 10 * 60
+
+# claim a batch of the buffer for the worker of the lock token and extend its lock. The batch is moved to the
+# processing list in one script, so the buffer is trimmed only by the items which are moved. A batch which is
+# left in the processing list by a crashed worker is claimed again before new items
+CLAIM_RATE_BATCH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return false
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+local items = redis.call('LRANGE', KEYS[3], 0, -1)
+if #items == 0 then
+    items = redis.call('LRANGE', KEYS[2], 0, tonumber(ARGV[2]) - 1)
+    if #items > 0 then
+        redis.call('RPUSH', KEYS[3], unpack(items))
+        redis.call('LTRIM', KEYS[2], #items, -1)
+    end
+end
+return items
+"""
+
+# remove the written batch from the processing list only if the worker still has the lock, else the list may have
+# the batch of another worker
+FINISH_RATE_BATCH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+# delete the pending score of the user only if it is not changed by a newer rate while draining the buffer
+DELETE_PENDING_RATE_SCRIPT = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def get_pending_rates_key(user_id):
+    return f'PENDING_RATES_{user_id}_USER'
+
+
+def push_rate(user, post, score):
+    """
+    Push accepted rate to the redis buffer to be written to database by write_buffered_rates task.
+    The score is kept as pending rate of the user until it's written, to read it before draining the buffer
+    """
+    connection = get_redis_connection('default')
+    pipeline = connection.pipeline()
+    pipeline.rpush(RATE_BUFFER_KEY, json.dumps({'post': post.id, 'user': user.id, 'score': score}))
+    pipeline.hset(get_pending_rates_key(user.id), post.id, score)
+    pipeline.execute()
+    return Rate(post=post, user=user, score=score)
+
+
+def push_rates(user, scores):
+    """
+    Push accepted rates of given {post_id: score} of the user to the redis buffer with one round trip
+    """
+    pipeline = get_redis_connection('default').pipeline()
+    pipeline.rpush(RATE_BUFFER_KEY, *[
+        json.dumps({'post': post_id, 'user': user.id, 'score': score}) for post_id, score in scores.items()
+    ])
+    pipeline.hset(get_pending_rates_key(user.id), mapping=scores)
+    pipeline.execute()
+
+
+def get_pending_rates(user):
+    """
+    Get {post_id: score} of the user's rates which are still in the buffer
+    """
+    if not user or not user.is_authenticated:
+        return {}
+    connection = get_redis_connection('default')
+    pending_rates = connection.hgetall(get_pending_rates_key(user.id))
+    return {int(post_id): int(score) for post_id, score in pending_rates.items()}
+
+
+async def aget_pending_rates(user):
+    """
+    Async get_pending_rates with the async redis client
+    """
+    if not user or not user.is_authenticated:
+        return {}
+    pending_rates = await get_async_redis_connection().hgetall(get_pending_rates_key(user.id))
+    return {int(post_id): int(score) for post_id, score in pending_rates.items()}
+
+
+def drain_rate_buffer():
+    """
+    Write buffered rates to database batch by batch until the buffer is empty. Each batch is claimed atomically
+    into the processing list while the worker has the lock, and the lock is extended for each batch
+    """
+    lock = cache.lock(RATE_BUFFER_LOCK_KEY, timeout=RATE_BUFFER_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):  # another worker is draining the buffer
+        return
+    try:
+        connection = get_redis_connection('default')
+        claim_batch = connection.register_script(CLAIM_RATE_BATCH_SCRIPT)
+        finish_batch = connection.register_script(FINISH_RATE_BATCH_SCRIPT)
+        keys = [lock.name, RATE_BUFFER_KEY, RATE_BUFFER_PROCESSING_KEY]
+        while True:
+            items = claim_batch(
+                keys=keys, args=[lock.local.token, settings.RATE_BUFFER_BATCH_SIZE, RATE_BUFFER_LOCK_TIMEOUT * 1000],
+            )
+            if not items:  # the buffer is empty or the lock expired and another worker drains the buffer
+                break
+            items = [json.loads(item) for item in items]
+            try:
+                write_rates_batch(items)
+            except IntegrityError:
+                # a rate which can't be written must not block the buffer, the batch is written one by one
+                # and the rejected rates are moved to the dead letter list
+                rejected_items = write_rates_items(items)
+                if rejected_items:
+                    connection.rpush(RATE_BUFFER_DEAD_LETTER_KEY, *[json.dumps(item) for item in rejected_items])
+            delete_pending_rates(items)
+            # items are removed after they are written, so a crashed batch will be written again by the next run
+            if not finish_batch(keys=keys[:1] + keys[2:], args=[lock.local.token]):
+                break
+    finally:
+        try:
+            lock.release()
+        except LockNotOwnedError:
+            pass
+
+
+def write_rates_batch(items):
+    """
+    Upsert a batch of rates (buffered or submitted in bulk) with bulk queries and apply the aggregated counters
+    per post and per user
+    """
+    # the last submitted score of each (post, user) wins, like update_or_create
+    scores = {(item['post'], item['user']): item['score'] for item in items}
+    post_ids = {post_id for post_id, user_id in scores}
+    user_ids = {user_id for post_id, user_id in scores}
+    # only the rates of the batch are locked, the posts of each user are looked up in the (user, post) index
+    users_post_ids = {}
+    for post_id, user_id in scores:
+        users_post_ids.setdefault(user_id, []).append(post_id)
+    rates_of_batch = reduce(operator.or_, (
+        Q(user_id=user_id, post_id__in=user_post_ids) for user_id, user_post_ids in users_post_ids.items()
+    ))
+
+    post_updates = {}
+    users_new_rates_count = {}
+    posts_new_rates_count = {}
+
+    with transaction.atomic():
+        existing_rates = {
+            (rate.post_id, rate.user_id): rate for rate in Rate.objects.select_for_update().filter(rates_of_batch)
+        }
+        existing_post_ids = set(Post.objects.filter(id__in=post_ids).values_list('id', flat=True))
+        existing_user_ids = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+
+        new_rates = []
+        rates_to_update = []
+        for (post_id, user_id), score in scores.items():
+            if post_id not in existing_post_ids or user_id not in existing_user_ids:
+                continue  # post or user is deleted after the rate is accepted
+            post_update = post_updates.setdefault(post_id, {
+                'rates_count': 0,
+                'total_rates_sum': 0,
+                'total_rates_sum_squared': 0,
+                'weighted_total_rates_sum': 0,
+            })
+            rate = existing_rates.get((post_id, user_id))
+            if rate is None:
+                new_rates.append(Rate(post_id=post_id, user_id=user_id, score=score))
+                post_update['rates_count'] += 1
+                post_update['total_rates_sum'] += score
+                post_update['total_rates_sum_squared'] += score ** 2
+                users_new_rates_count[user_id] = users_new_rates_count.get(user_id, 0) + 1
+                posts_new_rates_count[post_id] = posts_new_rates_count.get(post_id, 0) + 1
+            elif rate.score != score:
+                post_update['total_rates_sum'] += score - rate.score
+                post_update['total_rates_sum_squared'] += score ** 2 - rate.score ** 2
+                if rate.weight:
+                    post_update['weighted_total_rates_sum'] += (score - rate.score) * rate.weight
+                rate.score = score
+                rate.updated_at = timezone.now()
+                rates_to_update.append(rate)
+
+        Rate.objects.bulk_create(new_rates)
+        Rate.objects.bulk_update(rates_to_update, ['score', 'updated_at'])
+
+        # counters of all changed posts are updated with one query, each field by the change of each post
+        changed_posts = {
+            post_id: post_update for post_id, post_update in post_updates.items() if any(post_update.values())
+        }
+        updates = {}
+        for field in ('rates_count', 'total_rates_sum', 'total_rates_sum_squared', 'weighted_total_rates_sum'):
+            changes = [When(id=post_id, then=Value(post_update[field]))
+                       for post_id, post_update in changed_posts.items() if post_update[field]]
+            if changes:
+                updates[field] = F(field) + Case(*changes, default=Value(0), output_field=Post._meta.get_field(field))
+        if 'weighted_total_rates_sum' in updates:
+            updates['top_rate'] = Post.get_top_rate_expression(
+                updates['weighted_total_rates_sum'], F('weighted_rates_count'),
+            )
+        if updates:
+            Post.objects.filter(id__in=changed_posts).update(**updates)
+        if 'top_rate' in updates:  # top_rate and average_rate of the posts are changed
+            bump_post_list_generation()
+
+        # users with the same number of new rates are updated with one query
+        users_by_new_rates_count = {}
+        for user_id, new_rates_count in users_new_rates_count.items():
+            users_by_new_rates_count.setdefault(new_rates_count, []).append(user_id)
+        for new_rates_count, ids in users_by_new_rates_count.items():
+            User.objects.filter(id__in=ids).update(rates_count=F('rates_count') + new_rates_count)
+
+    invalidate_posts_aggregates(post_updates)
+    record_new_rates(posts_new_rates_count)
+
+
+def write_rates_items(items):
+    """
+    Write the rates of a batch which failed with IntegrityError one by one, and return the items which still fail.
+    The keys of the rates of detached partitions are kept, so these rates can't be created again
+    """
+    rejected_items = []
+    for item in items:
+        try:
+            write_rates_batch([item])
+        except IntegrityError:
+            rejected_items.append(item)
+    return rejected_items
+
+
+def delete_pending_rates(items):
+    """
+    Remove the pending scores of written buffered rates with one redis round trip, a pending score which is
+    changed by a newer rate is kept until the newer rate is written
+    """
+    scores = {(item['post'], item['user']): item['score'] for item in items}
+    pipeline = get_redis_connection('default').pipeline()
+    for (post_id, user_id), score in scores.items():
+        pipeline.eval(DELETE_PENDING_RATE_SCRIPT, 1, get_pending_rates_key(user_id), post_id, score)
+    pipeline.execute()
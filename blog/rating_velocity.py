@@ -0,0 +1,87 @@
+import time
+
+from django_redis import get_redis_connection
+
+from core.async_redis import get_async_redis_connection
+
+# new rates of each post are counted in buckets of 10 minutes, the velocity is the sum of buckets of last 5 hours
+RATING_VELOCITY_BUCKET_SECONDS = 10 * 60
+RATING_VELOCITY_WINDOW_SECONDS = 5 * 60 * 60
+
+
+def get_velocity_bucket_key(post_id, bucket):
+    return f'RATING_VELOCITY_{post_id}_{bucket}_POST'
+
+
+def get_current_bucket():
+    return int(time.time()) // RATING_VELOCITY_BUCKET_SECONDS
+
+
+def record_new_rates(posts_new_rates_count):
+    """
+    Add {post_id: count} new rates to the current bucket of each post with one redis round trip,
+    a bucket expires after it leaves the window
+    """
+    if not posts_new_rates_count:
+        return
+    bucket = get_current_bucket()
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    for post_id, new_rates_count in posts_new_rates_count.items():
+        key = get_velocity_bucket_key(post_id, bucket)
+        pipeline.incrby(key, new_rates_count)
+        pipeline.expire(key, RATING_VELOCITY_WINDOW_SECONDS + RATING_VELOCITY_BUCKET_SECONDS)
+    pipeline.execute()
+
+
+def get_window_buckets():
+    current_bucket = get_current_bucket()
+    return range(current_bucket - RATING_VELOCITY_WINDOW_SECONDS // RATING_VELOCITY_BUCKET_SECONDS + 1,
+                 current_bucket + 1)
+
+
+def get_posts_velocity(post_ids):
+    """
+    Get {post_id: number of new rates in last 5 hours} of given posts with one redis round trip
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    buckets = get_window_buckets()
+    values = get_redis_connection('default').mget(get_posts_window_keys(post_ids, buckets))
+    return sum_posts_buckets(post_ids, buckets, values)
+
+
+async def aget_posts_velocity(post_ids):
+    """
+    Async get_posts_velocity with the async redis client
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    buckets = get_window_buckets()
+    values = await get_async_redis_connection().mget(get_posts_window_keys(post_ids, buckets))
+    return sum_posts_buckets(post_ids, buckets, values)
+
+
+def get_posts_window_keys(post_ids, buckets):
+    return [get_velocity_bucket_key(post_id, bucket) for post_id in post_ids for bucket in buckets]
+
+
+def sum_posts_buckets(post_ids, buckets, values):
+    """
+    Get {post_id: sum of its buckets} from the values of get_posts_window_keys
+    """
+    posts_velocity = {}
+    for index, post_id in enumerate(post_ids):
+        post_values = values[index * len(buckets):(index + 1) * len(buckets)]
+        posts_velocity[post_id] = sum(int(value) for value in post_values if value is not None)
+    return posts_velocity
+
+
+def delete_posts_velocity(post_ids):
+    """
+    Remove all buckets of given posts in the window, so their velocity starts from zero
+    """
+    keys = [get_velocity_bucket_key(post_id, bucket) for post_id in post_ids for bucket in get_window_buckets()]
+    if keys:
+        get_redis_connection('default').delete(*keys)
@@ -0,0 +1,68 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from core.async_redis import cache_aget_many, cache_aset_many, get_async_redis_connection
+
+# cached post list pages are keyed by this generation, it's increased when posts or their top or trending rates
+# are changed so all cached pages are invalidated at once without finding the pages of each post. Counters of new
+# rates don't change it and are stale in cached pages until they expire
+POST_LIST_GENERATION_KEY = 'POST_LIST_GENERATION'
+
+
+def get_post_list_generation():
+    return int(get_redis_connection('default').get(POST_LIST_GENERATION_KEY) or 0)
+
+
+def bump_post_list_generation():
+    get_redis_connection('default').incr(POST_LIST_GENERATION_KEY)
+
+
+def get_post_list_cache_key(request, generation=None):
+    """
+    Cache key of a post list page of current generation. The body has absolute next and previous links, so the page
+    is keyed by the scheme, host and path (sync or async view) of the request, and its query params (cursor,
+    ordering, post_id) are sorted so the same page has the same key in any order of params
+    """
+    if generation is None:
+        generation = get_post_list_generation()
+    url = f'{request.scheme}://{request.get_host()}{request.path}?{urlencode(sorted(request.query_params.items()))}'
+    return f'POST_LIST_{generation}_{hashlib.md5(url.encode()).hexdigest()}'
+
+
+async def aget_post_list_cache_key(request):
+    generation = int(await get_async_redis_connection().get(POST_LIST_GENERATION_KEY) or 0)
+    return get_post_list_cache_key(request, generation)
+
+
+def get_cached_post_list(cache_key):
+    """
+    Get (etag, rendered json body) of a cached post list page or None
+    """
+    return cache.get(cache_key)
+
+
+async def aget_cached_post_list(cache_key):
+    return (await cache_aget_many([cache_key])).get(cache_key)
+
+
+def get_post_list_etag(body):
+    return f'"{hashlib.md5(body).hexdigest()}"'
+
+
+def cache_post_list(cache_key, body):
+    """
+    Cache rendered json body of a post list page and return its etag
+    """
+    etag = get_post_list_etag(body)
+    cache.set(cache_key, (etag, body), settings.POST_LIST_CACHE_TIMEOUT)
+    return etag
+
+
+async def acache_post_list(cache_key, body):
+    etag = get_post_list_etag(body)
+    await cache_aset_many({cache_key: (etag, body)}, settings.POST_LIST_CACHE_TIMEOUT)
+    return etag
@@ -1,43 +1,73 @@
-from django.core.cache import cache
 from rest_framework import serializers
+from .aggregates_cache import get_posts_aggregates
 from .models import Post, Rate
+from .rating_velocity import get_posts_velocity
+from .services import ArchivedRateError, get_user_rates, submit_rate, submit_rates
+
+ARCHIVED_RATE_ERROR = "The rate of this post is archived and can't be changed."
 
 
 class PostSerializer(serializers.ModelSerializer):
     average_rate = serializers.SerializerMethodField(read_only=True)
     rate_counts = serializers.SerializerMethodField(read_only=True)
     user_rate = serializers.SerializerMethodField(read_only=True)
+    rating_velocity = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Post
-        fields = ['pk', 'title', 'average_rate', 'rate_counts', 'user_rate']
+        fields = ['pk', 'title', 'average_rate', 'rate_counts', 'user_rate', 'rating_velocity']
+
+    def get_post_aggregates(self, obj):
+        if 'posts_aggregates' in self.context:  # cached aggregates of the whole page are loaded by the view
+            return self.context['posts_aggregates'][obj.id]
+        return get_posts_aggregates([obj.id], posts={obj.id: obj})[obj.id]
 
     def get_average_rate(self, obj):
-        cache_key = f'AVERAGE_RATE_{obj.id}_POST'
-        avg_rate = cache.get(cache_key)  # get cached value
-        if avg_rate:
-            return avg_rate
-        avg_rate = obj.weighted_average_rate
-        cache.set(cache_key, avg_rate, 5 * 60)  # cache the value for 5 minutes
-        return avg_rate
+        return self.get_post_aggregates(obj)['average_rate']
 
     def get_rate_counts(self, obj):
-        cache_key = f'RATES_COUNT_{obj.id}_POST'
-        rates_count = cache.get(cache_key) # get cached value
-        if rates_count:
-            return rates_count
-        rates_count = obj.rates_count
-        cache.set(cache_key, rates_count, 5 * 60)  # cache the value for 5 minutes
-        return rates_count
+        return self.get_post_aggregates(obj)['rate_counts']
 
     def get_user_rate(self, obj):
-        try:
-            user = self.context['user']
-            rate = Rate.objects.filter(post=obj, user=user)
-            score = rate.score
-        except Exception:
-            return None
-        return score
+        if 'user_rates' in self.context:  # user's rates of the whole page are loaded by the view
+            return self.context['user_rates'].get(obj.id)
+        return get_user_rates(self.context.get('user'), [obj.id]).get(obj.id)
+
+    def get_rating_velocity(self, obj):
+        if 'posts_velocity' in self.context:  # rating velocity of the whole page is loaded by the view
+            return self.context['posts_velocity'][obj.id]
+        return get_posts_velocity([obj.id])[obj.id]
+
+
+class PostValuesSerializer:
+    """
+    Read path of PostSerializer for a page of .values() rows of posts, builds the same dicts without binding
+    DRF fields to each post. Aggregates, user's rates and rating velocity of the page are read from the context
+    """
+    values_fields = ['id', 'title', 'rates_count', 'weighted_total_rates_sum', 'weighted_rates_count']
+
+    def __init__(self, rows, context):
+        self.rows = rows
+        self.context = context
+
+    @property
+    def data(self):
+        posts_aggregates = self.context['posts_aggregates']
+        user_rates = self.context['user_rates']
+        posts_velocity = self.context['posts_velocity']
+        data = []
+        for row in self.rows:
+            post_id = row['id']
+            aggregates = posts_aggregates[post_id]
+            data.append({
+                'pk': post_id,
+                'title': row['title'],
+                'average_rate': aggregates['average_rate'],
+                'rate_counts': aggregates['rate_counts'],
+                'user_rate': user_rates.get(post_id),
+                'rating_velocity': posts_velocity[post_id],
+            })
+        return data
 
 
 class RateSerializer(serializers.ModelSerializer):
@@ -47,16 +77,58 @@ class RateSerializer(serializers.ModelSerializer):
         fields = ['score', 'post']
 
     def create(self, validated_data):
-        user = self.context['user']
-        post = validated_data['post']
-        score = validated_data['score']
-        rate, created = Rate.objects.update_or_create(
-            post=post,
-            user=user,
-            defaults={'score': score},
-        )  # create new rate for given post and user if not exist, else update the score
-        cache_count_key = f'RATES_COUNT_{post.id}_POST'
-        cache_avg_key = f'AVERAGE_RATE_{post.id}_POST'
-        cache.delete(cache_count_key)  # remove post's cached count rate while adding or updating rates
-        cache.delete(cache_avg_key)  # remove post's cached average rate while adding or updating rates
-        return rate
+        try:
+            return submit_rate(
+                user=self.context['user'],
+                post=validated_data['post'],
+                score=validated_data['score'],
+            )
+        except ArchivedRateError:
+            raise serializers.ValidationError({'post': [ARCHIVED_RATE_ERROR]})
+
+
+class RateItemSerializer(serializers.ModelSerializer):
+    """
+    Item of BulkRateSerializer, the post is only an id here and posts of all items are validated with one in_bulk
+    """
+    post = serializers.IntegerField()
+
+    class Meta:
+        model = Rate
+        fields = ['score', 'post']
+
+
+class BulkRateSerializer(serializers.ListSerializer):
+    """
+    List of {post, score} rates of the user, the valid ones are submitted together with submit_rates.
+    An invalid item doesn't reject the list, the validated data and data have the rate or the errors of each item
+    in the order of the list
+    """
+    child = RateItemSerializer()
+
+    def run_child_validation(self, data):
+        try:
+            return super().run_child_validation(data)
+        except serializers.ValidationError as exc:
+            return {'errors': exc.detail}
+
+    def validate(self, attrs):
+        posts = Post.objects.in_bulk({item['post'] for item in attrs if 'errors' not in item})
+        does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+        return [
+            {'errors': {'post': [does_not_exist.format(pk_value=item['post'])]}}
+            if 'errors' not in item and item['post'] not in posts else item
+            for item in attrs
+        ]
+
+    def create(self, validated_data):
+        # the last score of a post wins like separate submissions
+        scores = {item['post']: item['score'] for item in validated_data if 'errors' not in item}
+        archived_post_ids = submit_rates(self.context['user'], scores)
+        return [
+            {'errors': {'post': [ARCHIVED_RATE_ERROR]}} if item.get('post') in archived_post_ids else item
+            for item in validated_data
+        ]
+
+    def to_representation(self, data):
+        return [item if 'errors' in item else self.child.to_representation(item) for item in data]
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.db import IntegrityError
+
+from .aggregates_cache import invalidate_posts_aggregates
+from .models import Rate
+from .rate_buffer import (
+    aget_pending_rates, get_pending_rates, push_rate, push_rates, write_rates_batch, write_rates_items,
+)
+from .rating_velocity import record_new_rates
+
+
+class ArchivedRateError(Exception):
+    """
+    The rate of the post and user is in a detached partition, its key is kept so the post can't be rated again
+    """
+
+
+def submit_rate(user, post, score):
+    """
+    Create new rate for given post and user if not exist, else update the score.
+    The rate row and the counters of the related post and user are written in one transaction,
+    counters are changed with F() expressions so concurrent rates of the same post never lose an increment.
+    New rates are counted in the rating velocity of the post.
+    If rate buffer is enabled, the rate is only pushed to the buffer and written later by write_buffered_rates task
+    """
+    if settings.RATE_BUFFER_ENABLED:
+        return push_rate(user, post, score)
+    try:
+        rate, created = Rate.objects.update_or_create(
+            post=post,
+            user=user,
+            defaults={'score': score},
+        )
+    except IntegrityError:  # a concurrent rate is updated by update_or_create, only an archived rate has no row
+        raise ArchivedRateError
+    invalidate_posts_aggregates([post.id])
+    if created:
+        record_new_rates({post.id: 1})
+    return rate
+
+
+def submit_rates(user, scores):
+    """
+    Create or update the user's rates of given {post_id: score} like submit_rate, with bulk queries for all rates.
+    New rates are inserted with one bulk_create, changed scores are updated with one bulk_update
+    and the counters of each post are changed once by the sum of its changes.
+    Returns the ids of the posts whose rates are archived and can't be changed
+    """
+    if not scores:
+        return set()
+    if settings.RATE_BUFFER_ENABLED:
+        push_rates(user, scores)
+        return set()
+    items = [{'post': post_id, 'user': user.id, 'score': score} for post_id, score in scores.items()]
+    try:
+        write_rates_batch(items)
+    except IntegrityError:
+        # a rate of the batch is created concurrently or archived, rates are written one by one so the concurrent
+        # rates are updated and only the archived rates are rejected
+        return {item['post'] for item in write_rates_items(items)}
+    return set()
+
+
+def get_user_rates(user, post_ids):
+    """
+    Get {post_id: score} of the user's rates on given posts with one query, the user can be the token user
+    of the authentication. Rates of the user which are not drained from the rate buffer yet are included
+    """
+    if not user or not user.is_authenticated:
+        return {}
+    user_rates = dict(Rate.objects.filter(user_id=user.id, post_id__in=post_ids).values_list('post_id', 'score'))
+    if settings.RATE_BUFFER_ENABLED:
+        pending_rates = get_pending_rates(user)
+        user_rates.update({post_id: pending_rates[post_id] for post_id in post_ids if post_id in pending_rates})
+    return user_rates
+
+
+async def aget_user_rates(user, post_ids):
+    """
+    Async get_user_rates, the rates are read with the async ORM and pending rates with the async redis client
+    """
+    if not user or not user.is_authenticated:
+        return {}
+    user_rates = {
+        post_id: score async for post_id, score in
+        Rate.objects.filter(user_id=user.id, post_id__in=post_ids).values_list('post_id', 'score')
+    }
+    if settings.RATE_BUFFER_ENABLED:
+        pending_rates = await aget_pending_rates(user)
+        user_rates.update({post_id: pending_rates[post_id] for post_id in post_ids if post_id in pending_rates})
+    return user_rates
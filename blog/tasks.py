@@ -1,6 +1,14 @@
 import datetime
-from django.db.models import Count
-from .models import Rate, Post
+from celery import chord
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import Post, Rate
+from .rate_buffer import drain_rate_buffer
+from .weighting import (
+    get_weighting_engine, merge_users_weight_deltas, update_average_rating_speed, update_trending_rates,
+    weight_pending_rates_of_shard,
+)
 
 from blog_project.celery import app
 
@@ -8,75 +16,53 @@ from blog_project.celery import app
 @app.task(name="calculate_post_total_rates_amount", autoregister=True)
 def calculate_post_total_rates_amount():
     """
-    Calculate weight of rates created at last {interval_hours} hours and have no weight and
-    the total rates amount for each post within a specific time interval
+    Calculate weight of rates which have no weight and the total rates amount for each post,
+    rates created at last {interval_hours} hours are the recent rates of the post
     """
     interval_hours = 5  # Define the time interval for recent rates calculation
-    last_hours = datetime.datetime.now() - datetime.timedelta(hours=interval_hours)
-
-    # Retrieve rates within the defined interval, along with related user and post
-    rates = Rate.objects.select_related('user', 'post').filter(weight__isnull=True, created_at__gte=last_hours)
-
-    posts_recent_rates_count = rates.values('post').annotate(count=Count('id'))  # Count recent rates for each post
-
-    post_updates = {}
-    rate_updates = []
-
-    # Iterate over rates to calculate weight, update post and user attributes
-    for rate in rates:
-        post = rate.post
-        user = rate.user
-        post_recent_rates_count = None
-        # Check if recent rates count for the post exists, if not, calculate it.
-        # to less query to database, all posts' rates count calculated in previous lines with one query to database.
-        if post not in post_updates:
-            for post_rate in posts_recent_rates_count:
-                if post_rate['post'] == post:
-                    post_recent_rates_count = post_rate['count']
-            if not post_recent_rates_count:
-                post_recent_rates_count = rates.filter(post=post).count()
-
-            # Store post updates
-            post_updates[post] = {
-                'weighted_total_rates_sum': 0,
-                'weighted_rates_count': 0,
-                'rating_speed_weight': post.get_rating_speed_weight(post_recent_rates_count)
-            }
-
-        # Calculate weight, check for outlier, update rate and post attributes
-        rating_speed_weight = post_updates[post]['rating_speed_weight']
-        user_weight = user.rate_weight
-        is_outlier = rate.get_is_outlier(
-            post_standard_deviation=post.standard_deviation,
-            post_average_rate=post.normal_average_rate,
-            post_rates_count=post.rates_count
-        )
-        weight = rate.calculate_weight(
-            rating_speed_weight,
-            user_weight,
-            is_outlier
-        )
-
-        # Store rate updates
-        rate.is_outlier = is_outlier
-        post_updates[post]['weighted_total_rates_sum'] += rate.score * weight
-        post_updates[post]['weighted_rates_count'] += weight
-        user.increase_total_rates_weight(weight)
-        rate.weight = weight
-        rate_updates.append(rate)
-
-    # Bulk update rates with weight and outlier status
-    Rate.objects.bulk_update(rate_updates, ['weight', 'is_outlier'])
+    last_hours = timezone.now() - datetime.timedelta(hours=interval_hours)
+
+    # rates count of last hours is the trending rate of the post
+    update_trending_rates(last_hours)
+
+    shards_count = settings.RATE_WEIGHTING_SHARDS
+    if shards_count > 1:
+        # Split rates by post between shards which are weighted by workers in parallel,
+        # weights of users are added by the callback after all shards are finished
+        chord(
+            calculate_post_total_rates_amount_shard.s(last_hours.isoformat(), shard, shards_count).set(
+                queue='periodic_queue'
+            )
+            for shard in range(shards_count)
+        )(merge_users_rates_weight.si().set(queue='periodic_queue'))
+        return
+
+    # Rates are weighted by the engine selected with RATE_WEIGHTING_ENGINE setting
+    get_weighting_engine()(recent_since=last_hours)
+    # weights of shards of a previous sharded run whose callback failed are not lost when shards are not used
+    merge_users_weight_deltas()
+
+
+@app.task(
+    name="calculate_post_total_rates_amount_shard", autoregister=True,
+    acks_late=True, autoretry_for=(Exception,), max_retries=3, retry_backoff=True,
+)
+def calculate_post_total_rates_amount_shard(recent_since, shard, shards_count):
+    """
+    Calculate weight of pending rates of the posts in given shard, retrying it only weights the remaining rates
+    """
+    weight_pending_rates_of_shard(datetime.datetime.fromisoformat(recent_since), shard, shards_count)
 
-    # Update posts with weighted total rates sum and weighted rates count
-    posts_to_update = []
-    for post, data in post_updates.items():
-        post.weighted_total_rates_sum += data['weighted_total_rates_sum']
-        post.weighted_rates_count += data['weighted_rates_count']
-        posts_to_update.append(post)
 
-    # Bulk update posts with weighted attributes
-    Post.objects.bulk_update(posts_to_update, ['weighted_total_rates_sum', 'weighted_rates_count'])
+@app.task(
+    name="merge_users_rates_weight", autoregister=True,
+    acks_late=True, autoretry_for=(Exception,), max_retries=3, retry_backoff=True,
+)
+def merge_users_rates_weight():
+    """
+    Add weights of rates weighted by the shards to total rates weight of users
+    """
+    merge_users_weight_deltas()
 
 
 @app.task(name="calculate_post_average_rating_speed", autoregister=True)
@@ -85,12 +71,18 @@ def calculate_post_average_rating_speed():
     Calculate the average rating speed for each post within a specific time interval
     """
     interval_hours = 24
-    last_hours = datetime.datetime.now() - datetime.timedelta(hours=interval_hours)
+    last_hours = timezone.now() - datetime.timedelta(hours=interval_hours)
 
-    # Retrieve posts with rates created within the defined interval
-    # to make sure calculating the average rating speed for posts undergoing continuous rating updates
-    posts = Post.objects.filter(rates__created_at__gte=last_hours)
+    # Update posts with rates created within the defined interval with one query,
+    # to make sure calculating the average rating speed for posts undergoing continuous rating updates.
+    # Only average_rating_speed is written, so counters changed by rates at the same time are not overwritten
+    posts = Post.objects.filter(Exists(Rate.objects.filter(post=OuterRef('pk'), created_at__gte=last_hours)))
+    update_average_rating_speed(posts)
 
-    # Iterate over posts to calculate average rating speed
-    for post in posts:
-        post.calculate_average_rating_speed()
+
+@app.task(name="write_buffered_rates", autoregister=True)
+def write_buffered_rates():
+    """
+    Write rates pushed to the rate buffer to database in batches
+    """
+    drain_rate_buffer()
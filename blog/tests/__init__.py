@@ -1,3 +1,9 @@
 from .test_rate_weight_calculation import *
 from .test_views import *
 from .test_models import *
+from .test_rate_ingestion import *
+from .test_rate_buffer import *
+from .test_aggregates_cache import *
+from .test_rating_velocity import *
+from .test_partitions import *
+from .test_indexes import *
@@ -0,0 +1,84 @@
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+from django_redis import get_redis_connection
+from blog.aggregates_cache import (
+    AGGREGATES_INVALIDATION_CHANNEL, get_aggregates_cache_stats, get_average_rate_cache_key, get_posts_aggregates,
+    invalidate_posts_aggregates, local_cache,
+)
+from blog.models import Post
+from core.pagination import CustomCursorPagination
+
+
+@pytest.mark.django_db
+class TestPostsAggregatesCache:
+
+    def setup_method(self):
+        self.posts = [
+            Post.objects.create(title=f'Test Post {i}', content='Content of test post')
+            for i in range(CustomCursorPagination.page_size)
+        ]
+        invalidate_posts_aggregates([post.id for post in self.posts])
+
+    def test_get_posts_aggregates(self):
+        rated_post = self.posts[0]
+        rated_post.rates_count = 2
+        rated_post.weighted_total_rates_sum = 3
+        rated_post.weighted_rates_count = 1
+        rated_post.save()
+        posts_aggregates = get_posts_aggregates([post.id for post in self.posts])
+        assert posts_aggregates[rated_post.id] == {'average_rate': 3, 'rate_counts': 2}
+        assert posts_aggregates[self.posts[1].id] == {'average_rate': None, 'rate_counts': 0}
+
+    def test_falsy_values_are_cached(self):
+        post_ids = [post.id for post in self.posts]
+        get_posts_aggregates(post_ids)
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            posts_aggregates = get_posts_aggregates(post_ids)
+        assert not set_many.called
+        assert all(aggregates == {'average_rate': None, 'rate_counts': 0} for aggregates in posts_aggregates.values())
+
+    def test_post_list_view_cache_round_trips(self, settings):
+        settings.POST_LIST_CACHE_TIMEOUT = 0  # render the page instead of reading it from the page cache
+        client = APIClient()
+        with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                patch.object(cache, 'set_many', wraps=cache.set_many) as set_many, \
+                patch.object(cache, 'get', wraps=cache.get) as get:
+            response = client.get(reverse('post_list'))
+        assert len(response.data['results']) == CustomCursorPagination.page_size
+        assert get_many.call_count == 1
+        assert set_many.call_count == 1
+        assert not get.called
+
+    def test_local_cache(self):
+        post_ids = [post.id for post in self.posts]
+        get_posts_aggregates(post_ids)
+        redis_stats = get_aggregates_cache_stats()['redis']
+        with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            get_posts_aggregates(post_ids)
+        assert not get_many.called
+        assert get_aggregates_cache_stats()['redis'] == redis_stats
+
+    def test_local_cache_invalidation(self):
+        post = self.posts[0]
+        get_posts_aggregates([post.id])
+        Post.objects.filter(id=post.id).update(rates_count=5)
+        invalidate_posts_aggregates([post.id])
+        assert get_posts_aggregates([post.id])[post.id]['rate_counts'] == 5
+
+    def test_local_cache_invalidation_from_other_process(self):
+        post = self.posts[0]
+        get_posts_aggregates([post.id])
+        key = get_average_rate_cache_key(post.id)
+        assert local_cache.get_many([key])
+        get_redis_connection('default').publish(AGGREGATES_INVALIDATION_CHANNEL, json.dumps([post.id]))
+        for _ in range(100):
+            if not local_cache.get_many([key]):
+                break
+            time.sleep(0.01)
+        assert not local_cache.get_many([key])
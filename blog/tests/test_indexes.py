@@ -0,0 +1,105 @@
+import pytest
+from django.db import connection
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+from account.models import User
+from blog.models import Post, Rate
+from core.pagination import CustomCursorPagination
+
+# indexes of the rate and post tables before the query indexes, deferred foreign key checks of the test data
+# are run first so the tables can be altered in the test transaction
+OLD_INDEXES_SQL = """
+SET CONSTRAINTS ALL IMMEDIATE;
+DROP INDEX blog_rate_user_post_idx, blog_rate_post_created_idx, blog_rate_created_idx, blog_post_created_idx;
+CREATE INDEX blog_rate_post_id_8fe5d47f ON blog_rate (post_id);
+CREATE INDEX blog_rate_user_id_f374297f ON blog_rate (user_id);
+CREATE INDEX blog_rate_post_id_b111ce_idx ON blog_rate (post_id);
+CREATE INDEX blog_rate_user_id_45e987_idx ON blog_rate (user_id);
+CREATE INDEX blog_rate_created_post_idx ON blog_rate (created_at, post_id);
+"""
+
+
+@pytest.fixture
+def query_shapes():
+    """
+    Rates of 50 posts by 200 users and the querysets of the queries which read them, keyed by name
+    """
+    users = User.objects.bulk_create([User(username=f'user{i}', password='password') for i in range(200)])
+    posts = Post.objects.bulk_create([Post(title=f'Post {i}', content='Content of test post') for i in range(50)])
+    Rate.objects.bulk_create([
+        Rate(post=post, user=user, score=(i + j) % 6) for i, user in enumerate(users) for j, post in enumerate(posts)
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE blog_rate, blog_post, account_user')
+
+    since = timezone.now() - timezone.timedelta(hours=5)
+    page_post_ids = [post.id for post in posts[:10]]
+    return {
+        'user_rates': Rate.objects.filter(user=users[0], post_id__in=page_post_ids).values_list('post_id', 'score'),
+        'update_or_create': Rate.objects.filter(post=posts[0], user=users[0]).select_for_update(),
+        'recent_rates_count': Rate.objects.filter(
+            Q(created_at__gte=since) | Q(weight__isnull=True), post_id__in=page_post_ids,
+        ).values_list('post_id').annotate(count=Count('id')),
+        'users_of_recent_rates': User.objects.filter(
+            Exists(Rate.objects.filter(user=OuterRef('pk'), created_at__gte=since))
+        ).values_list('id'),
+        'posts_of_recent_rates': Post.objects.filter(
+            Exists(Rate.objects.filter(post=OuterRef('pk'), created_at__gte=since))
+        ).values_list('id'),
+        'latest_posts': Post.objects.order_by('-created_at', '-id')[:10],
+        'latest_posts_page': Post.objects.filter(CustomCursorPagination().get_keyset_filter(
+            ['-created_at', '-pk'], [posts[20].created_at, posts[20].pk],
+        )).order_by('-created_at', '-pk')[:11],
+    }
+
+
+def explain_query_shapes(query_shapes):
+    """
+    Get {name: plan} of the query shapes, sequential and bitmap scans are disabled so the plans of the small test
+    tables show the index scan of each query like a large table
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('SET LOCAL enable_bitmapscan = off')
+    return {name: queryset.explain() for name, queryset in query_shapes.items()}
+
+
+def get_index_names(index_name):
+    """
+    Name of given index of the rate table and the names of its indexes on each partition
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE parent.relname = %s',
+            [index_name],
+        )
+        return [index_name] + [row[0] for row in cursor.fetchall()]
+
+
+@pytest.mark.django_db
+class TestQueryIndexes:
+
+    def test_query_indexes_plans(self, query_shapes):
+        plans = explain_query_shapes(query_shapes)
+        user_post_indexes = get_index_names('blog_rate_user_post_idx')
+        post_created_indexes = get_index_names('blog_rate_post_created_idx')
+        with connection.cursor() as cursor:
+            cursor.execute(OLD_INDEXES_SQL)
+        old_plans = explain_query_shapes(query_shapes)
+
+        for name in query_shapes:
+            print(f'\n{name} before:\n{old_plans[name]}\n{name} after:\n{plans[name]}')
+
+        assert any(index in plans['user_rates'] for index in user_post_indexes)
+        assert 'Filter' not in plans['user_rates']
+        assert any(index in plans['update_or_create'] for index in user_post_indexes)
+        assert any(index in plans['recent_rates_count'] for index in post_created_indexes)
+        assert any(index in plans['posts_of_recent_rates'] for index in post_created_indexes)
+        assert 'blog_post_created_idx' in plans['latest_posts']
+        assert 'Sort' not in plans['latest_posts']
+        assert 'Sort' in old_plans['latest_posts']
+        assert 'blog_post_created_idx' in plans['latest_posts_page']
+        assert 'Sort' not in plans['latest_posts_page']
@@ -1,3 +1,5 @@
+import statistics
+
 import pytest
 from blog.models import Post, Rate
 from django.contrib.auth import get_user_model
@@ -28,6 +30,23 @@ class TestPostModel:
         self.post.update_statistics(2)
         assert self.post.standard_deviation == pytest.approx(1.0, 0.001)
 
+    def test_standard_deviation_precision(self):
+        self.post.update_statistics(5)
+        self.post.update_statistics(5)
+        self.post.update_statistics(4)
+        assert self.post.standard_deviation == round(statistics.pstdev([5, 5, 4]), 3)
+
+    def test_standard_deviation_of_many_rates(self):
+        # half of 400 million rates are 4 and half are 5, sums are larger than a 32-bit column
+        Post.objects.filter(id=self.post.id).update(
+            rates_count=400_000_000,
+            total_rates_sum=200_000_000 * (4 + 5),
+            total_rates_sum_squared=200_000_000 * (4 ** 2 + 5 ** 2),
+        )
+        self.post.refresh_from_db()
+        assert self.post.normal_average_rate == 4.5
+        assert self.post.standard_deviation == 0.5
+
     def test_calculate_average_rating_speed(self):
         self.post.created_at = timezone.now() - timezone.timedelta(days=1)
         self.post.save()
@@ -48,6 +67,11 @@ class TestRateModel:
     def test_get_is_outlier(self):
         assert not self.rate.get_is_outlier()
 
+    def test_get_is_outlier_num_queries(self, django_assert_num_queries):
+        rate = Rate.objects.select_related('post').get(id=self.rate.id)
+        with django_assert_num_queries(0):
+            rate.get_is_outlier()
+
     def test_calculate_weight(self):
         weight_1 = Rate.calculate_weight(0.5, 0.8, False)
         weight_2 = Rate.calculate_weight(0.5, 0.8, True)
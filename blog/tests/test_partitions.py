@@ -0,0 +1,102 @@
+import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from account.models import User
+from blog.models import Post, Rate, RateKey
+from blog.partitions import (
+    create_rate_partition, detach_rate_partitions, get_month_start, get_rate_partition_name, get_rate_partitions,
+)
+from blog.serializers import ARCHIVED_RATE_ERROR
+from blog.views import BulkRateView, RateView
+
+
+@pytest.mark.django_db
+class TestRatePartitions:
+
+    def setup_method(self):
+        self.users = [User.objects.create(username=f'user{i}', password='password') for i in range(2)]
+        self.post = Post.objects.create(title='Test Post', content='Content of test post')
+
+    def get_rate_partition(self, rate):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM blog_rate WHERE id = %s', [rate.id])
+            return cursor.fetchone()[0]
+
+    def test_duplicate_rate(self):
+        Rate.objects.create(post=self.post, user=self.users[0], score=4)
+        assert RateKey.objects.filter(post=self.post, user=self.users[0]).exists()
+        with pytest.raises(IntegrityError), transaction.atomic():
+            Rate.objects.bulk_create([Rate(post=self.post, user=self.users[0], score=2)])
+
+    def test_delete_rate_deletes_key(self):
+        rate = Rate.objects.create(post=self.post, user=self.users[0], score=4)
+        rate.delete()
+        assert not RateKey.objects.exists()
+        Rate.objects.create(post=self.post, user=self.users[0], score=2)
+
+    def test_create_rate_partition(self):
+        month_start = get_month_start(timezone.now())
+        rate = Rate.objects.create(post=self.post, user=self.users[0], score=4)
+        assert self.get_rate_partition(rate) == 'blog_rate_default'
+
+        assert create_rate_partition(month_start)
+        assert not create_rate_partition(month_start)
+        assert get_rate_partitions() == {month_start: get_rate_partition_name(month_start)}
+        # rates of the month are moved out of the default partition and keep their keys
+        assert self.get_rate_partition(rate) == get_rate_partition_name(month_start)
+        assert RateKey.objects.filter(post=self.post, user=self.users[0]).exists()
+        new_rate = Rate.objects.create(post=self.post, user=self.users[1], score=3)
+        assert self.get_rate_partition(new_rate) == get_rate_partition_name(month_start)
+
+    def test_detach_rate_partitions(self):
+        old_rate = Rate.objects.create(post=self.post, user=self.users[0], score=4)
+        Rate.objects.filter(id=old_rate.id).update(created_at=timezone.now() - timezone.timedelta(days=70))
+        Rate.objects.create(post=self.post, user=self.users[1], score=3)
+        old_month_start = get_month_start(timezone.now() - timezone.timedelta(days=70))
+        create_rate_partition(old_month_start)
+        create_rate_partition(get_month_start(timezone.now()))
+
+        assert detach_rate_partitions(get_month_start(timezone.now(), months=-1)) == [
+            get_rate_partition_name(old_month_start)
+        ]
+        assert list(Rate.objects.values_list('user_id', flat=True)) == [self.users[1].id]
+        # the key of the detached rate is kept, so the user can't rate the post again
+        assert RateKey.objects.filter(post=self.post, user=self.users[0]).exists()
+        with pytest.raises(IntegrityError), transaction.atomic():
+            Rate.objects.create(post=self.post, user=self.users[0], score=5)
+
+    def detach_rate(self, rate):
+        Rate.objects.filter(id=rate.id).update(created_at=timezone.now() - timezone.timedelta(days=70))
+        create_rate_partition(get_month_start(timezone.now() - timezone.timedelta(days=70)))
+        detach_rate_partitions(get_month_start(timezone.now(), months=-1))
+
+    def test_rate_again_after_detach(self, monkeypatch):
+        monkeypatch.setattr(RateView, 'throttle_classes', [])
+        monkeypatch.setattr(BulkRateView, 'throttle_classes', [])
+        other_post = Post.objects.create(title='Other Post', content='Content of test post')
+        self.detach_rate(Rate.objects.create(post=self.post, user=self.users[0], score=4))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.users[0])}')
+
+        response = client.post(reverse('submit_rate'), {'post': self.post.id, 'score': 2}, format='json')
+        assert response.status_code == 400
+        assert response.data == {'post': [ARCHIVED_RATE_ERROR]}
+
+        response = client.post(reverse('submit_rates'), [
+            {'post': self.post.id, 'score': 2}, {'post': other_post.id, 'score': 3},
+        ], format='json')
+        assert response.status_code == 200
+        assert response.data['results'] == [
+            {'errors': {'post': [ARCHIVED_RATE_ERROR]}}, {'score': 3, 'post': other_post.id},
+        ]
+        assert list(Rate.objects.values_list('post_id', 'score')) == [(other_post.id, 3)]
+        self.post.refresh_from_db()
+        assert self.post.rates_count == 1
+
+    def test_rate_partitions_command(self):
+        call_command('rate_partitions', months_ahead=2)
+        assert sorted(get_rate_partitions()) == [get_month_start(timezone.now(), months=i) for i in range(3)]
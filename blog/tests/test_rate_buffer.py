@@ -0,0 +1,163 @@
+import json
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from account.models import User
+from blog.models import Post, Rate
+from blog.partitions import create_rate_partition, detach_rate_partitions, get_month_start
+from blog import rate_buffer
+from blog.rate_buffer import (
+    RATE_BUFFER_DEAD_LETTER_KEY, RATE_BUFFER_KEY, RATE_BUFFER_LOCK_KEY, RATE_BUFFER_PROCESSING_KEY, drain_rate_buffer,
+    get_pending_rates, get_pending_rates_key,
+)
+from blog.serializers import PostSerializer
+from blog.views import RateView
+
+
+@pytest.mark.django_db
+class TestRateBuffer:
+
+    @pytest.fixture(autouse=True)
+    def enable_rate_buffer(self, settings, monkeypatch):
+        settings.RATE_BUFFER_ENABLED = True
+        # the rate throttle allows 10 rates a day so should be disabled
+        monkeypatch.setattr(RateView, 'throttle_classes', [])
+        self.user = User.objects.create(username='testuser', password='testpassword')
+        self.post = Post.objects.create(title='Test Post', content='Content of test post')
+        connection = get_redis_connection('default')
+        connection.delete(
+            RATE_BUFFER_KEY, RATE_BUFFER_PROCESSING_KEY, RATE_BUFFER_DEAD_LETTER_KEY,
+            get_pending_rates_key(self.user.id),
+        )
+        cache.delete(RATE_BUFFER_LOCK_KEY)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def submit_rate(self, score):
+        return self.client.post(reverse('submit_rate'), {'post': self.post.id, 'score': score}, format='json')
+
+    def test_submit_rate_is_accepted(self):
+        response = self.submit_rate(4)
+        assert response.status_code == 202
+        assert not Rate.objects.filter(post=self.post, user=self.user).exists()
+        assert get_pending_rates(self.user) == {self.post.id: 4}
+        # the user reads the buffered score before it is written to database
+        assert PostSerializer(self.post, context={'user': self.user}).data['user_rate'] == 4
+
+    def test_drain_rate_buffer(self):
+        self.submit_rate(4)
+        drain_rate_buffer()
+        self.post.refresh_from_db()
+        self.user.refresh_from_db()
+        assert Rate.objects.get(post=self.post, user=self.user).score == 4
+        assert self.post.rates_count == 1
+        assert self.post.total_rates_sum == 4
+        assert self.post.total_rates_sum_squared == 16
+        assert self.user.rates_count == 1
+        assert get_pending_rates(self.user) == {}
+        assert get_redis_connection('default').llen(RATE_BUFFER_KEY) == 0
+
+    def test_drain_rate_buffer_upsert(self):
+        self.submit_rate(4)
+        self.submit_rate(1)
+        drain_rate_buffer()
+        self.submit_rate(2)
+        drain_rate_buffer()
+        self.post.refresh_from_db()
+        self.user.refresh_from_db()
+        assert Rate.objects.filter(post=self.post, user=self.user).count() == 1
+        assert Rate.objects.get(post=self.post, user=self.user).score == 2
+        assert self.post.rates_count == 1
+        assert self.post.total_rates_sum == 2
+        assert self.post.total_rates_sum_squared == 4
+        assert self.user.rates_count == 1
+
+    def test_drain_rate_buffer_writes_crashed_batch_first(self):
+        connection = get_redis_connection('default')
+        self.submit_rate(4)
+        # the batch of a worker which crashed before removing it from the processing list
+        connection.rename(RATE_BUFFER_KEY, RATE_BUFFER_PROCESSING_KEY)
+        self.submit_rate(2)
+        drain_rate_buffer()
+        self.post.refresh_from_db()
+        assert Rate.objects.get(post=self.post, user=self.user).score == 2
+        assert self.post.rates_count == 1
+        assert connection.llen(RATE_BUFFER_KEY) == 0
+        assert connection.llen(RATE_BUFFER_PROCESSING_KEY) == 0
+
+    def test_drain_rate_buffer_past_rejected_rate(self):
+        connection = get_redis_connection('default')
+        other_post = Post.objects.create(title='Other Post', content='Content of test post')
+        # the rate of the post is in a detached partition, so the post can't be rated again
+        rate = Rate.objects.create(post=self.post, user=self.user, score=4)
+        Rate.objects.filter(id=rate.id).update(created_at=timezone.now() - timezone.timedelta(days=70))
+        create_rate_partition(get_month_start(timezone.now() - timezone.timedelta(days=70)))
+        detach_rate_partitions(get_month_start(timezone.now(), months=-1))
+        self.submit_rate(2)
+        self.client.post(reverse('submit_rate'), {'post': other_post.id, 'score': 3}, format='json')
+
+        drain_rate_buffer()
+        assert list(Rate.objects.values_list('post_id', 'score')) == [(other_post.id, 3)]
+        assert [json.loads(item) for item in connection.lrange(RATE_BUFFER_DEAD_LETTER_KEY, 0, -1)] == [
+            {'post': self.post.id, 'user': self.user.id, 'score': 2},
+        ]
+        assert connection.llen(RATE_BUFFER_KEY) == 0
+        assert connection.llen(RATE_BUFFER_PROCESSING_KEY) == 0
+        assert get_pending_rates(self.user) == {}
+
+    def test_drain_rate_buffer_stops_when_lock_is_lost(self, settings, monkeypatch):
+        settings.RATE_BUFFER_BATCH_SIZE = 1
+        connection = get_redis_connection('default')
+        self.submit_rate(4)
+        self.submit_rate(2)
+        write_rates_batch = rate_buffer.write_rates_batch
+
+        def write_rates_batch_and_lose_lock(items):
+            write_rates_batch(items)
+            # the lock expires during the batch and another worker takes it
+            connection.set(cache.make_key(RATE_BUFFER_LOCK_KEY), 'other worker')
+
+        monkeypatch.setattr(rate_buffer, 'write_rates_batch', write_rates_batch_and_lose_lock)
+        drain_rate_buffer()
+        assert Rate.objects.get(post=self.post, user=self.user).score == 4
+        # the claimed batch is left to the worker of the lock and the next item is not claimed
+        assert connection.llen(RATE_BUFFER_PROCESSING_KEY) == 1
+        assert connection.llen(RATE_BUFFER_KEY) == 1
+
+    def test_write_rates_batch_locks_only_rates_of_batch(self):
+        other_user = User.objects.create(username='otheruser', password='testpassword')
+        other_post = Post.objects.create(title='Other Post', content='Content of test post')
+        rates = [
+            Rate.objects.create(post=self.post, user=self.user, score=1),
+            Rate.objects.create(post=other_post, user=other_user, score=1),
+            Rate.objects.create(post=self.post, user=other_user, score=1),
+            Rate.objects.create(post=other_post, user=self.user, score=1),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            rate_buffer.write_rates_batch([
+                {'post': self.post.id, 'user': self.user.id, 'score': 4},
+                {'post': other_post.id, 'user': other_user.id, 'score': 4},
+            ])
+        # rows of the locking query are the rates of the batch, not all rates of its posts and users
+        select_for_update = next(query['sql'] for query in queries if query['sql'].endswith('FOR UPDATE'))
+        with connection.cursor() as cursor:
+            cursor.execute(select_for_update)
+            assert sorted(row[0] for row in cursor.fetchall()) == [rates[0].id, rates[1].id]
+
+    def test_drain_rate_buffer_num_queries(self, django_assert_num_queries):
+        users = [User.objects.create(username=f'user{i}', password='testpassword') for i in range(20)]
+        for user in users:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            self.submit_rate(3)
+        # savepoint, select rates, select posts, select users, insert rates, update post, update users, release
+        with django_assert_num_queries(8):
+            drain_rate_buffer()
+        self.post.refresh_from_db()
+        assert self.post.rates_count == 20
@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+from django.db import connection
+from account.models import User
+from blog.models import Post, Rate
+from blog.services import submit_rate
+
+
+@pytest.mark.django_db
+class TestSubmitRate:
+
+    def setup_method(self):
+        self.user = User.objects.create(username='testuser', password='testpassword')
+        self.post = Post.objects.create(title='Test Post', content='Content of test post')
+
+    def test_submit_new_rate(self):
+        submit_rate(self.user, self.post, 4)
+        self.post.refresh_from_db()
+        self.user.refresh_from_db()
+        assert self.post.rates_count == 1
+        assert self.post.total_rates_sum == 4
+        assert self.post.total_rates_sum_squared == 16
+        assert self.user.rates_count == 1
+
+    def test_update_rate_score(self):
+        submit_rate(self.user, self.post, 4)
+        submit_rate(self.user, self.post, 2)
+        self.post.refresh_from_db()
+        self.user.refresh_from_db()
+        assert Rate.objects.get(post=self.post, user=self.user).score == 2
+        assert self.post.rates_count == 1
+        assert self.post.total_rates_sum == 2
+        assert self.post.total_rates_sum_squared == 4
+        assert self.user.rates_count == 1
+
+    def test_update_weighted_rate_score(self):
+        submit_rate(self.user, self.post, 4)
+        Rate.objects.filter(post=self.post, user=self.user).update(weight=0.5)
+        Post.objects.filter(id=self.post.id).update(weighted_total_rates_sum=2, weighted_rates_count=0.5)
+        submit_rate(self.user, self.post, 2)
+        self.post.refresh_from_db()
+        assert self.post.weighted_total_rates_sum == pytest.approx(1)
+        assert self.post.top_rate == 2
+
+    def test_submit_new_rate_num_queries(self, django_assert_num_queries):
+        # savepoint, select for update, savepoint, update user, update post, insert rate, release x2
+        with django_assert_num_queries(8):
+            submit_rate(self.user, self.post, 4)
+
+    def test_update_rate_num_queries(self, django_assert_num_queries):
+        submit_rate(self.user, self.post, 4)
+        # savepoint, select for update, update post, update rate, release
+        with django_assert_num_queries(5):
+            submit_rate(self.user, self.post, 2)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentSubmitRate:
+
+    def test_concurrent_rates_of_one_post(self):
+        threads_count = 20
+        post = Post.objects.create(title='Test Post', content='Content of test post')
+        users = [User.objects.create(username=f'user{i}', password='testpassword') for i in range(threads_count)]
+        scores = [(i % 5) + 1 for i in range(threads_count)]
+        barrier = threading.Barrier(threads_count)
+        errors = []
+
+        def rate_post(user, score):
+            try:
+                barrier.wait()
+                submit_rate(user, post, score)
+                # submit the score twice to race the update path too
+                submit_rate(user, post, score)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rate_post, args=(user, score)) for user, score in zip(users, scores)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        post.refresh_from_db()
+        assert not errors
+        assert post.rates_count == threads_count
+        assert post.total_rates_sum == sum(scores)
+        assert post.total_rates_sum_squared == sum(score ** 2 for score in scores)
+        assert all(user.rates_count == 1 for user in User.objects.filter(id__in=[user.id for user in users]))
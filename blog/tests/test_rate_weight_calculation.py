@@ -1,9 +1,22 @@
 import pytest
 from django.utils import timezone
 from django.contrib.auth import get_user_model
-from blog.models import Post, Rate
-from blog.tasks import calculate_post_total_rates_amount, calculate_post_average_rating_speed
+from blog.models import Post, Rate, UserWeightDelta
+from blog.rating_velocity import delete_posts_velocity, record_new_rates
+from blog.response_cache import get_post_list_generation
+from blog.tasks import (
+    calculate_post_average_rating_speed, calculate_post_total_rates_amount, calculate_post_total_rates_amount_shard,
+    merge_users_rates_weight,
+)
+from blog.weighting import (
+    get_posts_columns, update_trending_rates, weight_pending_rates, weight_pending_rates_numpy,
+    weight_pending_rates_sql, weight_rates, weight_rates_columns,
+)
 import random
+import time
+from unittest.mock import patch
+
+import numpy as np
 
 User = get_user_model()
 
@@ -180,3 +193,298 @@ class TestRateWeightCalculation:
         assert first_rate_is_outlier is False, 'First rate is outlier'
         assert second_rate_is_outlier is True, 'Second rate is not outlier'
 
+
+@pytest.mark.django_db
+class TestWeightPendingRates:
+
+    def setup_method(self):
+        self.posts = [Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(2)]
+        self.users = [User.objects.create(username=f'user{i}', password='password', rate_weight=0.5) for i in range(6)]
+        for i, user in enumerate(self.users):
+            for post in self.posts:
+                Rate.objects.create(post=post, user=user, score=(i % 5) + 1)
+        delete_posts_velocity([post.id for post in self.posts])
+
+    def test_weight_pending_rates(self):
+        weight_pending_rates(recent_since=timezone.now() - timezone.timedelta(hours=5), chunk_size=5)
+        assert not Rate.objects.filter(weight__isnull=True).exists()
+        for post in self.posts:
+            post.refresh_from_db()
+            rates = Rate.objects.filter(post=post)
+            assert post.weighted_total_rates_sum == pytest.approx(sum(rate.score * rate.weight for rate in rates))
+            assert post.weighted_rates_count == pytest.approx(sum(rate.weight for rate in rates))
+        for user in self.users:
+            user.refresh_from_db()
+            assert user.total_rates_weight == pytest.approx(sum(rate.weight for rate in user.rates.all()))
+
+    def test_weight_late_rates(self):
+        # rates which are created before the recent interval are still weighted
+        late_rate = Rate.objects.filter(post=self.posts[0]).first()
+        Rate.objects.filter(id=late_rate.id).update(created_at=timezone.now() - timezone.timedelta(days=1))
+        calculate_post_total_rates_amount()
+        assert not Rate.objects.filter(weight__isnull=True).exists()
+
+    def test_weight_only_new_rates(self):
+        calculate_post_total_rates_amount()
+        weighted_posts = {post.id: post.weighted_rates_count for post in Post.objects.all()}
+        new_rate = Rate.objects.create(post=self.posts[0], user=User.objects.create(username='new_user'), score=3)
+        calculate_post_total_rates_amount()
+        new_rate.refresh_from_db()
+        assert new_rate.weight is not None
+        self.posts[0].refresh_from_db()
+        assert self.posts[0].weighted_rates_count == pytest.approx(weighted_posts[self.posts[0].id] + new_rate.weight)
+        assert Rate.objects.filter(weight__isnull=True).count() == 0
+
+    def test_weight_pending_rates_num_queries(self, django_assert_num_queries):
+        # posts, count of recent rates per post, then for each of 3 chunks: savepoint, select rates for update,
+        # savepoint, update rates, update posts, update users, release x2, and the last empty chunk
+        with django_assert_num_queries(2 + 3 * 8 + 3):
+            weight_pending_rates(recent_since=timezone.now() - timezone.timedelta(hours=5), chunk_size=5)
+
+
+class WeightingEnginesData:
+
+    def setup_method(self):
+        users = User.objects.bulk_create([
+            User(username=f'user{i}', password='password', rate_weight=round((i % 10 + 1) / 10, 3)) for i in range(1100)
+        ])
+        self.posts = [
+            Post.objects.create(title='Popular Post', content='Content of test post', average_rating_speed=37.5),
+            Post.objects.create(title='New Post', content='Content of test post', average_rating_speed=0.2),
+            # rating speed weights of 2 recent rates are ties, 0.009 / 2 and 0.125 / 2 are rounded to 0.004 and 0.062
+            Post.objects.create(title='Tie Post', content='Content of test post', average_rating_speed=0.009),
+            Post.objects.create(title='Exact Tie Post', content='Content of test post', average_rating_speed=0.125),
+        ]
+        rates = [Rate(post=self.posts[0], user=user, score=[4, 5, 4, 1, 5, 3][i % 6]) for i, user in enumerate(users)]
+        rates += [Rate(post=self.posts[1], user=user, score=i % 6) for i, user in enumerate(users[:30])]
+        rates += [Rate(post=post, user=user, score=3) for post in self.posts[2:] for user in users[:2]]
+        Rate.objects.bulk_create(rates)
+        delete_posts_velocity([post.id for post in self.posts])
+        for post in self.posts:
+            scores = [rate.score for rate in rates if rate.post_id == post.id]
+            post.rates_count = len(scores)
+            post.total_rates_sum = sum(scores)
+            post.total_rates_sum_squared = sum(score ** 2 for score in scores)
+            post.save()
+
+    def weighting_result(self):
+        return (
+            {rate.id: (rate.weight, rate.is_outlier) for rate in Rate.objects.all()},
+            {post.id: (post.weighted_total_rates_sum, post.weighted_rates_count) for post in Post.objects.all()},
+            {user.id: user.total_rates_weight for user in User.objects.all()},
+        )
+
+    def reset_weights(self):
+        Rate.objects.update(weight=None, is_outlier=False)
+        Post.objects.update(weighted_total_rates_sum=0, weighted_rates_count=0)
+        User.objects.update(total_rates_weight=0)
+
+
+@pytest.mark.django_db
+class TestWeightingEngines(WeightingEnginesData):
+
+    def test_sql_engine_same_as_python_engine(self):
+        since = timezone.now() - timezone.timedelta(hours=5)
+        weight_pending_rates(recent_since=since)
+        python_rates, python_posts, python_users = self.weighting_result()
+        self.reset_weights()
+        weight_pending_rates_sql(recent_since=since)
+        sql_rates, sql_posts, sql_users = self.weighting_result()
+
+        assert any(is_outlier for weight, is_outlier in python_rates.values())
+        assert sql_rates == python_rates
+        for post_id, (weighted_total_rates_sum, weighted_rates_count) in python_posts.items():
+            assert sql_posts[post_id][0] == pytest.approx(weighted_total_rates_sum)
+            assert sql_posts[post_id][1] == pytest.approx(weighted_rates_count)
+        for user_id, total_rates_weight in python_users.items():
+            assert sql_users[user_id] == pytest.approx(total_rates_weight)
+
+    def test_sql_engine_same_as_python_engine_with_velocity(self):
+        # the popular post is counted by its rating velocity and the other posts in database by all engines
+        record_new_rates({self.posts[0].id: 7})
+        since = timezone.now() - timezone.timedelta(hours=5)
+        weight_pending_rates(recent_since=since)
+        python_rates, python_posts, python_users = self.weighting_result()
+        self.reset_weights()
+        weight_pending_rates_sql(recent_since=since)
+        sql_rates, sql_posts, sql_users = self.weighting_result()
+
+        rate = Rate.objects.filter(post=self.posts[0], is_outlier=False).select_related('user').first()
+        rating_speed_weight = self.posts[0].get_rating_speed_weight(7)
+        assert rate.weight == Rate.calculate_weight(rating_speed_weight, rate.user.rate_weight, False)
+        assert sql_rates == python_rates
+        for post_id, (weighted_total_rates_sum, weighted_rates_count) in python_posts.items():
+            assert sql_posts[post_id][0] == pytest.approx(weighted_total_rates_sum)
+            assert sql_posts[post_id][1] == pytest.approx(weighted_rates_count)
+
+    def test_numpy_engine_same_as_python_engine(self):
+        since = timezone.now() - timezone.timedelta(hours=5)
+        weight_pending_rates(recent_since=since)
+        python_rates, python_posts, python_users = self.weighting_result()
+        self.reset_weights()
+        weight_pending_rates_numpy(recent_since=since, chunk_size=500)
+        numpy_rates, numpy_posts, numpy_users = self.weighting_result()
+
+        assert numpy_rates == python_rates
+        for post_id, (weighted_total_rates_sum, weighted_rates_count) in python_posts.items():
+            assert numpy_posts[post_id][0] == pytest.approx(weighted_total_rates_sum)
+            assert numpy_posts[post_id][1] == pytest.approx(weighted_rates_count)
+        for user_id, total_rates_weight in python_users.items():
+            assert numpy_users[user_id] == pytest.approx(total_rates_weight)
+
+    @pytest.mark.parametrize('engine', [weight_pending_rates, weight_pending_rates_numpy, weight_pending_rates_sql])
+    def test_engines_update_top_rate(self, engine):
+        generation = get_post_list_generation()
+        engine(recent_since=timezone.now() - timezone.timedelta(hours=5))
+        for post in Post.objects.all():
+            assert post.top_rate == pytest.approx(post.weighted_average_rate)
+        assert get_post_list_generation() == generation + 1  # the top page is changed
+
+    def test_sql_engine_num_queries(self, django_assert_num_queries):
+        # posts of pending rates to read their rating velocity, and the weighting statement
+        with django_assert_num_queries(2):
+            weight_pending_rates_sql(recent_since=timezone.now() - timezone.timedelta(hours=5))
+        assert not Rate.objects.filter(weight__isnull=True).exists()
+
+
+@pytest.mark.django_db
+class TestShardedWeighting(WeightingEnginesData):
+
+    def test_sharded_weighting_same_as_python_engine(self):
+        since = timezone.now() - timezone.timedelta(hours=5)
+        weight_pending_rates(recent_since=since)
+        python_result = self.weighting_result()
+        self.reset_weights()
+
+        shards_count = 3
+        for shard in range(shards_count):
+            calculate_post_total_rates_amount_shard(since.isoformat(), shard, shards_count)
+            # retrying a finished shard does not weight its rates again
+            calculate_post_total_rates_amount_shard(since.isoformat(), shard, shards_count)
+        merge_users_rates_weight()
+        merge_users_rates_weight()
+
+        sharded_rates, sharded_posts, sharded_users = self.weighting_result()
+        assert sharded_rates == python_result[0]
+        for post_id, (weighted_total_rates_sum, weighted_rates_count) in python_result[1].items():
+            assert sharded_posts[post_id][0] == pytest.approx(weighted_total_rates_sum)
+            assert sharded_posts[post_id][1] == pytest.approx(weighted_rates_count)
+        for user_id, total_rates_weight in python_result[2].items():
+            assert sharded_users[user_id] == pytest.approx(total_rates_weight)
+        assert not UserWeightDelta.objects.exists()
+
+    def test_sharded_weighting_chord(self, settings):
+        settings.RATE_WEIGHTING_SHARDS = 4
+        with patch('blog.tasks.chord') as chord:
+            calculate_post_total_rates_amount()
+        shards = list(chord.call_args.args[0])
+        assert [shard.args[1:] for shard in shards] == [(shard, 4) for shard in range(4)]
+        assert chord.return_value.call_args.args[0].task == 'merge_users_rates_weight'
+        assert Rate.objects.filter(weight__isnull=True).exists()
+
+    def test_not_sharded_weighting_merges_deltas(self, settings):
+        settings.RATE_WEIGHTING_SHARDS = 1
+        user = User.objects.get(username='user0')
+        UserWeightDelta.objects.create(user=user, weight=2)  # left by a sharded run whose callback failed
+        calculate_post_total_rates_amount()
+        user.refresh_from_db()
+        rates_weight = sum(Rate.objects.filter(user=user).values_list('weight', flat=True))
+        assert user.total_rates_weight == pytest.approx(rates_weight + 2)
+        assert not UserWeightDelta.objects.exists()
+
+
+class TestWeightingEnginesBenchmark:
+
+    def test_numpy_weighting_benchmark(self):
+        """
+        Compare weighting a large chunk of rates in python loop and with numpy, without database
+        """
+        rates_count = 200000
+        posts_weighting_data = {
+            post_id: {
+                'rating_speed_weight': round(random.random(), 3),
+                'standard_deviation': round(random.random() * 2, 3),
+                'average_rate': round(random.random() * 5, 3),
+                'rates_count': random.choice([10, 5000]),
+            }
+            for post_id in range(1, 101)
+        }
+        users = [User(id=user_id, rate_weight=round(random.random(), 3)) for user_id in range(1, 10001)]
+        rates = [
+            Rate(id=rate_id, post_id=random.randint(1, 100), user=random.choice(users), score=random.randint(0, 5))
+            for rate_id in range(1, rates_count + 1)
+        ]
+
+        start = time.perf_counter()
+        weight_rates(rates, posts_weighting_data)
+        python_duration = time.perf_counter() - start
+
+        scores = np.array([rate.score for rate in rates])
+        post_ids = np.array([rate.post_id for rate in rates])
+        user_weights = np.array([rate.user.rate_weight for rate in rates])
+        start = time.perf_counter()
+        posts_columns = get_posts_columns(posts_weighting_data)
+        post_indexes = np.searchsorted(posts_columns['post_id'], post_ids)
+        weights, is_outliers = weight_rates_columns(scores, post_indexes, user_weights, posts_columns)
+        numpy_duration = time.perf_counter() - start
+
+        print(f'Python weighting of {rates_count} rates: {python_duration:.3f}s')
+        print(f'Numpy weighting of {rates_count} rates: {numpy_duration:.3f}s')
+
+        assert [rate.weight for rate in rates] == weights.tolist()
+        assert [rate.is_outlier for rate in rates] == is_outliers.tolist()
+        assert numpy_duration < python_duration
+
+
+@pytest.mark.django_db
+class TestTrendingRates:
+
+    def test_update_trending_rates(self):
+        users = [User.objects.create(username=f'user{i}', password='password') for i in range(3)]
+        trending_post, old_post, cold_post = [
+            Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(3)
+        ]
+        for user in users:
+            Rate.objects.create(post=trending_post, user=user, score=4)
+        old_rate = Rate.objects.create(post=old_post, user=users[0], score=4)
+        Rate.objects.filter(id=old_rate.id).update(created_at=timezone.now() - timezone.timedelta(days=1))
+        Post.objects.filter(id=cold_post.id).update(trending_rate=5)  # no rates in last hours anymore
+
+        update_trending_rates(timezone.now() - timezone.timedelta(hours=5))
+        trending_rates = dict(Post.objects.values_list('id', 'trending_rate'))
+        assert trending_rates == {trending_post.id: 3, old_post.id: 0, cold_post.id: 0}
+
+    def test_unchanged_trending_rates_keep_cached_pages(self):
+        post = Post.objects.create(title='Test Post', content='Content of test post')
+        Rate.objects.create(post=post, user=User.objects.create(username='user'), score=4)
+        since = timezone.now() - timezone.timedelta(hours=5)
+        update_trending_rates(since)
+        generation = get_post_list_generation()
+        update_trending_rates(since)
+        assert get_post_list_generation() == generation
+        Rate.objects.create(post=post, user=User.objects.create(username='other_user'), score=4)
+        update_trending_rates(since)
+        assert get_post_list_generation() == generation + 1
+
+
+@pytest.mark.django_db
+class TestAverageRatingSpeed:
+
+    def test_calculate_post_average_rating_speed(self, django_assert_num_queries):
+        posts = [Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(3)]
+        for i, post in enumerate(posts):
+            Post.objects.filter(id=post.id).update(created_at=timezone.now() - timezone.timedelta(days=i + 1))
+            for score in range(i + 1):
+                Rate.objects.create(post=post, user=User.objects.create(username=f'user{i}{score}'), score=score)
+        not_rated_post = Post.objects.create(title='Not Rated Post', content='Content of test post')
+
+        with django_assert_num_queries(1):
+            calculate_post_average_rating_speed()
+
+        for post in posts:
+            post.refresh_from_db()
+            expected_post = Post.objects.get(id=post.id)
+            expected_post.calculate_average_rating_speed()
+            assert post.average_rating_speed == pytest.approx(expected_post.average_rating_speed, abs=0.001)
+        not_rated_post.refresh_from_db()
+        assert not_rated_post.average_rating_speed == 0
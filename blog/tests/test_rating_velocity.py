@@ -0,0 +1,54 @@
+import pytest
+from django.utils import timezone
+from account.models import User
+from blog.models import Post, Rate
+from blog.rate_buffer import write_rates_batch
+from blog.rating_velocity import delete_posts_velocity, get_posts_velocity, record_new_rates
+from blog.serializers import PostSerializer
+from blog.services import submit_rate
+from blog.weighting import get_pending_rates, get_posts_weighting_data
+
+
+@pytest.mark.django_db
+class TestRatingVelocity:
+
+    def setup_method(self):
+        self.users = [User.objects.create(username=f'user{i}', password='password') for i in range(3)]
+        self.posts = [
+            Post.objects.create(title=f'Test Post {i}', content='Content of test post', average_rating_speed=1)
+            for i in range(2)
+        ]
+        delete_posts_velocity([post.id for post in self.posts])
+
+    def test_submit_rate_records_new_rates(self):
+        for user in self.users:
+            submit_rate(user, self.posts[0], 4)
+        submit_rate(self.users[0], self.posts[0], 2)  # updated score is not a new rate
+        assert get_posts_velocity([post.id for post in self.posts]) == {self.posts[0].id: 3, self.posts[1].id: 0}
+
+    def test_buffered_rates_record_new_rates(self):
+        write_rates_batch([
+            {'post': self.posts[1].id, 'user': self.users[0].id, 'score': 3},
+            {'post': self.posts[1].id, 'user': self.users[1].id, 'score': 3},
+            {'post': self.posts[1].id, 'user': self.users[0].id, 'score': 5},
+        ])
+        assert get_posts_velocity([self.posts[1].id]) == {self.posts[1].id: 2}
+
+    def test_weighting_data_reads_velocity(self, django_assert_num_queries):
+        Rate.objects.create(post=self.posts[0], user=self.users[0], score=4)
+        record_new_rates({self.posts[0].id: 4})
+        # posts of pending rates, without counting recent rates in database
+        with django_assert_num_queries(1):
+            data = get_posts_weighting_data(get_pending_rates(), timezone.now() - timezone.timedelta(hours=5))
+        assert data[self.posts[0].id]['rating_speed_weight'] == 0.25
+
+    def test_weighting_data_of_untracked_posts(self):
+        for user in self.users:
+            Rate.objects.create(post=self.posts[1], user=user, score=4)
+        data = get_posts_weighting_data(get_pending_rates(), timezone.now() - timezone.timedelta(hours=5))
+        assert data[self.posts[1].id]['rating_speed_weight'] == 0.333
+
+    def test_rating_velocity_field(self):
+        submit_rate(self.users[0], self.posts[0], 4)
+        assert PostSerializer(self.posts[0]).data['rating_velocity'] == 1
+        assert PostSerializer(self.posts[1]).data['rating_velocity'] == 0
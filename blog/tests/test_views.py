@@ -1,11 +1,24 @@
+import json
+import time
+from base64 import b64encode
+
 import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import AccessToken
 from account.models import User
 from blog.models import Post, Rate
-from blog.serializers import RateSerializer, PostSerializer
-from blog.views import RateView
+from blog.aggregates_cache import get_posts_aggregates
+from blog.rating_velocity import get_posts_velocity
+from blog.serializers import PostValuesSerializer, RateSerializer, PostSerializer
+from blog.services import get_user_rates, submit_rate
+from blog.views import BulkRateThrottle, BulkRateView, PostStatsView, PostView, RateThrottle, RateView
+from core.async_redis import close_async_redis_connection
 
 
 @pytest.mark.django_db
@@ -16,10 +29,255 @@ class TestPostListView:
         response = client.get(url)
         assert response.status_code == 200
 
+    def test_post_list_view_user_rate(self):
+        user = User.objects.create(username='testuser', password='testpassword')
+        rated_post = Post.objects.create(title='Rated Post', content='Content of test post')
+        Post.objects.create(title='Not Rated Post', content='Content of test post')
+        Rate.objects.create(post=rated_post, user=user, score=3)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = client.get(reverse('post_list'))
+        user_rates = {post['pk']: post['user_rate'] for post in response.data['results']}
+        assert user_rates[rated_post.id] == 3
+        assert list(user_rates.values()).count(None) == 1
+
+    def test_post_list_view_num_queries(self, django_assert_num_queries):
+        user = User.objects.create(username='testuser', password='testpassword')
+        posts = [Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(10)]
+        for post in posts:
+            Rate.objects.create(post=post, user=user, score=4)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        # page of posts and user's rates of the page, the user is read from the token
+        with django_assert_num_queries(2):
+            response = client.get(reverse('post_list'))
+        assert len(response.data['results']) == 10
+        assert all(post['user_rate'] == 4 for post in response.data['results'])
+
+
+@pytest.mark.django_db
+class TestPostListPagination:
+    def setup_method(self):
+        created_at = timezone.now()
+        posts = Post.objects.bulk_create([
+            Post(title=f'Test Post {i}', content='Content of test post') for i in range(25)
+        ])
+        # posts with the same created_at are ordered by pk
+        for i, post in enumerate(posts):
+            Post.objects.filter(id=post.id).update(created_at=created_at - timezone.timedelta(minutes=i // 3))
+        self.post_ids = list(Post.objects.order_by('-created_at', '-pk').values_list('id', flat=True))
+        self.client = APIClient()
+
+    def test_pages_in_view_ordering(self):
+        post_ids = []
+        url = reverse('post_list')
+        while url:
+            response = self.client.get(url)
+            post_ids += [post['pk'] for post in response.data['results']]
+            assert response.data['has_more'] == (response.data['next'] is not None)
+            url = response.data['next']
+        assert post_ids == self.post_ids
+
+    def test_previous_page(self):
+        first_page = self.client.get(reverse('post_list')).data
+        second_page = self.client.get(first_page['next']).data
+        assert first_page['previous'] is None
+        previous_page = self.client.get(second_page['previous']).data
+        assert [post['pk'] for post in previous_page['results']] == self.post_ids[:10]
+        assert previous_page['previous'] is None
+        assert previous_page['has_more']
+
+    def test_page_num_queries(self, django_assert_num_queries):
+        next_url = self.client.get(reverse('post_list')).data['next']
+        # only the page query, without a count
+        with django_assert_num_queries(1):
+            response = self.client.get(next_url)
+        assert [post['pk'] for post in response.data['results']] == self.post_ids[10:20]
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('post_list'), {'cursor': 'invalid'})
+        assert response.status_code == 404
+
+    @pytest.mark.parametrize('position', [
+        [None, None], [{}, {}], [[1], [2]], ['not a date', 1], {'created_at': 1, 'pk': 1}, 'ab', [1],
+    ])
+    def test_invalid_cursor_position(self, position):
+        cursor = b64encode(json.dumps({'p': position, 'r': 0}).encode('ascii')).decode('ascii')
+        response = self.client.get(reverse('post_list'), {'cursor': cursor})
+        assert response.status_code == 404
+
+
+@pytest.mark.django_db
+class TestPostLeaderboardView:
+    def setup_method(self):
+        self.posts = [
+            Post.objects.create(title=f'Test Post {i}', content='Content of test post', top_rate=top_rate,
+                                trending_rate=trending_rate)
+            for i, (top_rate, trending_rate) in enumerate([(3.5, 10), (4.8, 2), (0, 0), (2.1, 7)])
+        ]
+        self.client = APIClient()
+
+    def get_post_ids(self, ordering):
+        response = self.client.get(reverse('post_list'), {'ordering': ordering})
+        assert response.status_code == 200
+        return [post['pk'] for post in response.data['results']]
+
+    def test_top_posts(self):
+        assert self.get_post_ids('top') == [self.posts[i].id for i in (1, 0, 3, 2)]
+
+    def test_trending_posts(self):
+        assert self.get_post_ids('trending') == [self.posts[i].id for i in (0, 3, 1, 2)]
+
+    def test_top_posts_pages(self):
+        Post.objects.bulk_create([
+            Post(title=f'Page Post {i}', content='Content of test post', top_rate=1) for i in range(12)
+        ])
+        response = self.client.get(reverse('post_list'), {'ordering': 'top'})
+        post_ids = [post['pk'] for post in response.data['results']]
+        response = self.client.get(response.data['next'])
+        post_ids += [post['pk'] for post in response.data['results']]
+        assert len(post_ids) == len(set(post_ids)) == 16
+        top_rates = dict(Post.objects.values_list('id', 'top_rate'))
+        assert [top_rates[post_id] for post_id in post_ids] == sorted(top_rates.values(), reverse=True)
+
+    def test_invalid_ordering(self):
+        response = self.client.get(reverse('post_list'), {'ordering': 'title'})
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestPostListResponseCache:
+    def setup_method(self):
+        self.posts = [Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(3)]
+        self.client = APIClient()
+
+    def test_cached_page_num_queries(self, django_assert_num_queries):
+        response = self.client.get(reverse('post_list'))
+        with django_assert_num_queries(0):
+            cached_response = self.client.get(reverse('post_list'))
+        assert cached_response.status_code == 200
+        assert cached_response['Content-Type'] == 'application/json'
+        assert cached_response.json() == response.json()
+        assert cached_response['ETag'] == response['ETag']
+
+    def test_pages_are_cached_by_query_params(self):
+        self.client.get(reverse('post_list'))
+        response = self.client.get(reverse('post_list'), {'post_id': self.posts[0].id})
+        assert [post['pk'] for post in response.json()['results']] == [self.posts[0].id]
+
+    def test_pages_are_cached_by_scheme(self):
+        for i in range(10):
+            Post.objects.create(title=f'Other Post {i}', content='Content of test post')
+        # next links of the cached body are absolute urls of the request
+        assert self.client.get(reverse('post_list')).json()['next'].startswith('http://testserver/')
+        assert self.client.get(reverse('post_list'), secure=True).json()['next'].startswith('https://testserver/')
+
+    def test_not_modified(self, django_assert_num_queries):
+        etag = self.client.get(reverse('post_list'))['ETag']
+        with django_assert_num_queries(0):
+            response = self.client.get(reverse('post_list'), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response.content == b''
+        assert response['ETag'] == etag
+
+    def test_invalidated_by_new_post(self):
+        etag = self.client.get(reverse('post_list'))['ETag']
+        post = Post.objects.create(title='New Post', content='Content of test post')
+        response = self.client.get(reverse('post_list'), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.json()['results'][0]['pk'] == post.id
+        assert response['ETag'] != etag
+
+    def test_not_invalidated_by_new_rate(self):
+        user = User.objects.create(username='testuser', password='testpassword')
+        self.client.get(reverse('post_list'))
+        # a rate without weight changes only the counters, which are shown when the page expires
+        submit_rate(user, self.posts[0], 4)
+        results = {post['pk']: post for post in self.client.get(reverse('post_list')).json()['results']}
+        assert results[self.posts[0].id]['rate_counts'] == 0
+
+    def test_invalidated_by_weighted_rate(self):
+        user = User.objects.create(username='testuser', password='testpassword')
+        rate = submit_rate(user, self.posts[0], 4)
+        Rate.objects.filter(id=rate.id).update(weight=1)
+        Post.objects.filter(id=self.posts[0].id).update(weighted_total_rates_sum=4, weighted_rates_count=1, top_rate=4)
+        self.client.get(reverse('post_list'))
+        submit_rate(user, self.posts[0], 2)  # changes the weighted average and top rate of the post
+        results = {post['pk']: post for post in self.client.get(reverse('post_list')).json()['results']}
+        assert results[self.posts[0].id]['average_rate'] == 2
+
+    def test_authenticated_pages_are_not_cached(self):
+        user = User.objects.create(username='testuser', password='testpassword')
+        self.client.get(reverse('post_list'))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = self.client.get(reverse('post_list'))
+        assert 'ETag' not in response
+        assert all('user_rate' in post for post in response.data['results'])
+
+    def test_cache_disabled(self, settings, django_assert_num_queries):
+        settings.POST_LIST_CACHE_TIMEOUT = 0
+        self.client.get(reverse('post_list'))
+        with django_assert_num_queries(1):
+            response = self.client.get(reverse('post_list'))
+        assert 'ETag' not in response
+
+
+@pytest.mark.django_db
+class TestPostStatsView:
+    def setup_method(self):
+        self.user = User.objects.create(username='testuser', password='testpassword')
+        self.posts = [Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(5)]
+        submit_rate(self.user, self.posts[1], 4)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def get_stats(self, post_ids):
+        return self.client.get(reverse('post_stats'), {'ids': ','.join(str(post_id) for post_id in post_ids)})
+
+    def test_post_stats(self):
+        post_ids = [self.posts[3].id, self.posts[1].id, 0, self.posts[3].id]
+        response = self.get_stats(post_ids)
+        assert response.status_code == 200
+        assert response.data['results'] == [
+            {'pk': self.posts[3].id, 'average_rate': None, 'rate_counts': 0, 'user_rate': None},
+            {'pk': self.posts[1].id, 'average_rate': None, 'rate_counts': 1, 'user_rate': 4},
+        ]
+
+    def test_same_stats_as_post_list(self):
+        post_list = self.client.get(reverse('post_list')).data['results']
+        stats = self.get_stats([post['pk'] for post in post_list]).data['results']
+        fields = ['pk', 'average_rate', 'rate_counts', 'user_rate']
+        assert stats == [{field: post[field] for field in fields} for post in post_list]
+
+    def test_num_queries(self, django_assert_num_queries):
+        posts = Post.objects.bulk_create([
+            Post(title=f'Stats Post {i}', content='Content of test post') for i in range(100)
+        ])
+        # in_bulk of posts missed in cache and user's rates, the user is read from the token
+        with django_assert_num_queries(2) as queries:
+            response = self.get_stats([post.id for post in posts])
+        assert len(response.data['results']) == 100
+        assert '"content"' not in queries.captured_queries[0]['sql']  # only the fields of the aggregates
+        # aggregates are cached now
+        with django_assert_num_queries(1):
+            self.get_stats([post.id for post in posts])
+
+    def test_deleted_post(self):
+        post_id = self.posts[1].id
+        assert len(self.get_stats([post_id]).data['results']) == 1
+        self.posts[1].delete()
+        assert self.get_stats([post_id]).data['results'] == []
+
+    def test_invalid_ids(self):
+        assert self.client.get(reverse('post_stats')).status_code == 400
+        assert self.get_stats(['a']).status_code == 400
+        assert self.get_stats(range(1, PostStatsView.max_post_ids + 2)).status_code == 400
+
+
 @pytest.mark.django_db
 class TestSubmitRateView:
     def test_submit_rate_view(self):
-        RateView.throttle_classes = []  # UserRateThrottle caches the data so should be disabled
+        RateView.throttle_classes = []  # the rate throttle allows 10 rates a day so should be disabled
         authorized_user = User.objects.create(username='authorized_user', password='testpassword')
         unauthorized_user = User.objects.create(username='unauthorized_user', password='testpassword')
         post = Post.objects.create(title='Test Post', content='Content of test post')
@@ -44,6 +302,184 @@ class TestSubmitRateView:
         assert unauthorized_response.status_code == 401
         assert not Rate.objects.filter(post=post, user=unauthorized_user).exists()
 
+
+@pytest.mark.django_db
+class TestSubmitRatesView:
+    def setup_method(self):
+        self.user = User.objects.create(username='testuser', password='testpassword')
+        self.posts = [Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(5)]
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def submit_rates(self, rates):
+        return self.client.post(reverse('submit_rates'), rates, format='json')
+
+    def test_submit_rates(self, monkeypatch):
+        monkeypatch.setattr(BulkRateView, 'throttle_classes', [])
+        submit_rate(self.user, self.posts[0], 1)
+        response = self.submit_rates([
+            {'post': self.posts[0].id, 'score': 4},
+            {'post': self.posts[1].id, 'score': 5},
+            {'post': self.posts[2].id, 'score': 2},
+            {'post': self.posts[2].id, 'score': 3},
+        ])
+        assert response.status_code == 200
+        assert response.data['results'][1] == {'score': 5, 'post': self.posts[1].id}
+        assert dict(Rate.objects.filter(user=self.user).values_list('post_id', 'score')) == {
+            self.posts[0].id: 4, self.posts[1].id: 5, self.posts[2].id: 3,
+        }
+        for post in self.posts[:3]:
+            post.refresh_from_db()
+        assert [post.rates_count for post in self.posts[:3]] == [1, 1, 1]
+        assert [post.total_rates_sum for post in self.posts[:3]] == [4, 5, 3]
+        assert [post.total_rates_sum_squared for post in self.posts[:3]] == [16, 25, 9]
+        self.user.refresh_from_db()
+        assert self.user.rates_count == 3
+
+    def test_item_errors(self, monkeypatch):
+        monkeypatch.setattr(BulkRateView, 'throttle_classes', [])
+        response = self.submit_rates([
+            {'post': self.posts[0].id, 'score': 6},
+            {'post': 0, 'score': 3},
+            {'score': 3},
+            {'post': self.posts[1].id, 'score': 3},
+        ])
+        assert response.status_code == 200
+        results = response.data['results']
+        assert list(results[0]['errors']) == ['score']
+        assert results[1] == {'errors': {'post': ['Invalid pk "0" - object does not exist.']}}
+        assert list(results[2]['errors']) == ['post']
+        assert results[3] == {'score': 3, 'post': self.posts[1].id}
+        assert list(Rate.objects.filter(user=self.user).values_list('post_id', flat=True)) == [self.posts[1].id]
+
+    def test_invalid_list(self, monkeypatch):
+        monkeypatch.setattr(BulkRateView, 'throttle_classes', [])
+        assert self.submit_rates({'post': self.posts[0].id, 'score': 3}).status_code == 400
+        too_many_rates = [{'post': self.posts[0].id, 'score': 3}] * (BulkRateThrottle.rate_limit + 1)
+        assert self.submit_rates(too_many_rates).status_code == 400
+
+    def test_num_queries_do_not_grow_with_rates(self, monkeypatch, django_assert_num_queries):
+        monkeypatch.setattr(BulkRateView, 'throttle_classes', [])
+        posts = Post.objects.bulk_create([
+            Post(title=f'Bulk Post {i}', content='Content of test post') for i in range(BulkRateThrottle.rate_limit)
+        ])
+        # user, posts of in_bulk, existing rates, posts and users of the batch, rates insert, posts and user updates
+        # and the savepoint of the transaction
+        with django_assert_num_queries(10):
+            response = self.submit_rates([{'post': post.id, 'score': 3} for post in posts])
+        assert response.status_code == 200
+        assert Rate.objects.filter(user=self.user).count() == BulkRateThrottle.rate_limit
+        assert set(Post.objects.filter(id__in=[post.id for post in posts]).values_list('rates_count', flat=True)) == {1}
+
+    def test_throttle_counts_rates(self):
+        rates = [{'post': post.id, 'score': 3} for post in self.posts]
+        assert self.submit_rates(rates).status_code == 200
+        assert self.submit_rates(rates).status_code == 200
+        response = self.submit_rates(rates[:1])
+        assert response.status_code == 429
+        assert Rate.objects.filter(user=self.user).count() == 5
+
+    def test_list_over_rate_limit(self):
+        posts = Post.objects.bulk_create([
+            Post(title=f'Bulk Post {i}', content='Content of test post') for i in range(BulkRateThrottle.rate_limit + 1)
+        ])
+        rates = [{'post': post.id, 'score': 3} for post in posts]
+        # the list can never pass the throttle, so it's rejected and not counted
+        response = self.submit_rates(rates)
+        assert response.status_code == 400
+        assert response.data == {
+            'non_field_errors': [f'Ensure this field has no more than {BulkRateThrottle.rate_limit} elements.'],
+        }
+        assert self.submit_rates(rates[:BulkRateThrottle.rate_limit]).status_code == 200
+
+    def test_throttle_denies_list_over_rate_limit(self, rf):
+        posts = Post.objects.bulk_create([
+            Post(title=f'Bulk Post {i}', content='Content of test post') for i in range(BulkRateThrottle.rate_limit + 1)
+        ])
+        request = Request(rf.post('/'), parsers=[JSONParser()])
+        request._full_data = [{'post': post.id, 'score': 3} for post in posts]
+        request.user = self.user
+        assert not BulkRateThrottle().allow_request(request, BulkRateView())
+
+
+@pytest.mark.django_db
+class TestAsyncPostListView:
+    def setup_method(self):
+        self.user = User.objects.create(username='testuser', password='testpassword')
+        self.posts = [
+            Post.objects.create(title=f'Test Post {i}', content='Content of test post', top_rate=i % 4)
+            for i in range(15)
+        ]
+        for post in self.posts[-5:]:
+            submit_rate(self.user, post, 4)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def get(self, url, data=None, **headers):
+        async def get():
+            try:
+                return await AsyncClient().get(url, data, headers=headers)
+            finally:
+                await close_async_redis_connection()
+        return async_to_sync(get)()
+
+    @pytest.mark.parametrize('ordering', ['latest', 'top', 'trending'])
+    def test_same_data_as_sync_view(self, ordering):
+        sync_client = APIClient()
+        sync_client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        sync_data = sync_client.get(reverse('post_list'), {'ordering': ordering}).json()
+        response = self.get(reverse('async_post_list'), {'ordering': ordering}, **self.headers)
+        assert response.status_code == 200
+        assert response.json()['results'] == sync_data['results']
+        assert any(post['user_rate'] == 4 for post in response.json()['results'])
+
+    def test_pages(self):
+        post_ids = []
+        url = reverse('async_post_list')
+        while url:
+            data = self.get(url, **self.headers).json()
+            post_ids += [post['pk'] for post in data['results']]
+            url = data['next']
+        assert post_ids == [post.id for post in reversed(self.posts)]
+
+    def test_anonymous_cached_page(self, django_assert_num_queries):
+        response = self.get(reverse('async_post_list'))
+        assert all(post['user_rate'] is None for post in response.json()['results'])
+        with django_assert_num_queries(0):
+            cached_response = self.get(reverse('async_post_list'))
+        assert cached_response.content == response.content
+        not_modified_response = self.get(reverse('async_post_list'), If_None_Match=response['ETag'])
+        assert not_modified_response.status_code == 304
+
+    def test_anonymous_pages_are_cached_by_view(self):
+        sync_next = APIClient().get(reverse('post_list')).json()['next']
+        async_next = self.get(reverse('async_post_list')).json()['next']
+        assert sync_next.startswith(f'http://testserver{reverse("post_list")}?')
+        assert async_next.startswith(f'http://testserver{reverse("async_post_list")}?')
+
+    def test_errors(self):
+        assert self.get(reverse('async_post_list'), {'ordering': 'title'}).status_code == 400
+        assert self.get(reverse('async_post_list'), {'cursor': 'invalid'}).status_code == 404
+        assert self.get(reverse('async_post_list'), Authorization='Bearer invalid').status_code == 401
+
+
+@pytest.mark.django_db
+class TestRateThrottle:
+    def test_rates_of_user_are_throttled(self, monkeypatch):
+        monkeypatch.setattr(RateView, 'throttle_classes', (RateThrottle, ))
+        user = User.objects.create(username='testuser', password='testpassword')
+        other_user = User.objects.create(username='otheruser', password='testpassword')
+        post = Post.objects.create(title='Test Post', content='Content of test post')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        for score in range(RateThrottle.rate_limit):
+            assert client.post(reverse('submit_rate'), {'post': post.id, 'score': score % 6}).status_code == 200
+        response = client.post(reverse('submit_rate'), {'post': post.id, 'score': 1})
+        assert response.status_code == 429
+        assert 0 < int(response['Retry-After']) <= 24 * 60 * 60  # until the first rate is a day old
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other_user)}')
+        assert client.post(reverse('submit_rate'), {'post': post.id, 'score': 1}).status_code == 200
+
+
 @pytest.mark.django_db
 class TestPostSerializer:
     def test_post_serializer(self):
@@ -54,6 +490,63 @@ class TestPostSerializer:
         assert data['average_rate'] is None
         assert data['rate_counts'] == 0
 
+
+@pytest.mark.django_db
+class TestPostValuesSerializer:
+    def setup_method(self):
+        self.user = User.objects.create(username='testuser', password='testpassword')
+        self.posts = [
+            Post.objects.create(title=f'Test Post {i}', content='Content of test post') for i in range(100)
+        ]
+        for post in self.posts[::3]:
+            Rate.objects.create(post=post, user=self.user, score=4)
+        post_ids = [post.id for post in self.posts]
+        self.context = {
+            'user': self.user,
+            'user_rates': get_user_rates(self.user, post_ids),
+            'posts_aggregates': get_posts_aggregates(post_ids),
+            'posts_velocity': get_posts_velocity(post_ids),
+        }
+
+    def test_same_data_as_post_serializer(self):
+        rows = Post.objects.order_by('-pk').values(*PostValuesSerializer.values_fields)
+        posts = Post.objects.order_by('-pk')
+        assert PostValuesSerializer(rows, context=self.context).data == \
+            PostSerializer(posts, many=True, context=self.context).data
+
+    def test_post_list_view_serializers(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        PostView.use_values_serializer = False
+        try:
+            response = client.get(reverse('post_list'), {'ordering': 'top'})
+        finally:
+            PostView.use_values_serializer = True
+        assert client.get(reverse('post_list'), {'ordering': 'top'}).data == response.data
+
+    def test_values_serializer_benchmark(self):
+        """
+        Compare serializing a page of 100 posts with PostSerializer and PostValuesSerializer, without database
+        """
+        posts = list(Post.objects.order_by('-pk'))
+        rows = list(Post.objects.order_by('-pk').values(*PostValuesSerializer.values_fields))
+        repeat = 50
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            PostSerializer(posts, many=True, context=self.context).data
+        serializer_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            PostValuesSerializer(rows, context=self.context).data
+        values_serializer_duration = time.perf_counter() - start
+
+        print(f'PostSerializer of {repeat} pages: {serializer_duration:.3f}s')
+        print(f'PostValuesSerializer of {repeat} pages: {values_serializer_duration:.3f}s')
+        assert values_serializer_duration < serializer_duration
+
+
 @pytest.mark.django_db
 class TestRateSerializer:
     def test_rate_serializer(self):
@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import PostView, RateView
+from .views import AsyncPostView, BulkRateView, PostStatsView, PostView, RateView
 
 urlpatterns = [
     path("posts/", PostView.as_view(), name='post_list'),
-    path("submit-rate/", RateView.as_view(), name='submit_rate')
+    path("async/posts/", AsyncPostView.as_view(), name='async_post_list'),
+    path("posts/stats/", PostStatsView.as_view(), name='post_stats'),
+    path("submit-rate/", RateView.as_view(), name='submit_rate'),
+    path("submit-rates/", BulkRateView.as_view(), name='submit_rates'),
 ]
\ No newline at end of file
@@ -1,45 +1,228 @@
+import asyncio
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from django.views import View
 from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.throttling import UserRateThrottle
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework.views import APIView
 
-from .serializers import PostSerializer, RateSerializer
+from .serializers import BulkRateSerializer, PostSerializer, PostValuesSerializer, RateSerializer
+from .aggregates_cache import aget_posts_aggregates, get_posts_aggregates
 from .models import Post
+from .rating_velocity import aget_posts_velocity, get_posts_velocity
+from .response_cache import (
+    acache_post_list, aget_cached_post_list, aget_post_list_cache_key, cache_post_list, get_cached_post_list,
+    get_post_list_cache_key,
+)
+from .services import aget_user_rates, get_user_rates
+from account.authentication import CachedUserJWTAuthentication
 from core.pagination import CustomCursorPagination
+from core.throttling import UserRedisRateThrottle
 
 
-class RateThrottle(UserRateThrottle):
+class RateThrottle(UserRedisRateThrottle):
+    scope = 'rate'
     rate_limit = 10
     rate = f'{rate_limit}/day'
 
 
-class PostView(APIView):
-    authentication_classes = (JWTAuthentication,)
+class BulkRateThrottle(RateThrottle):
+    """
+    Rate throttle of bulk rates, each rate of the list is counted like a request of RateView, so a list of more
+    rates than rate_limit is always denied
+    """
+
+    def get_cost(self, request, view):
+        return len(request.data) if isinstance(request.data, list) else 1
+
+
+class PostListMixin:
+    """
+    Orderings, queryset and cached page responses of the sync and async post list views
+    """
+    # each ordering is paged through its (field, pk) index, leaderboards through the indexes of materialized columns
+    orderings = {
+        'latest': ('-created_at', '-pk'),
+        'top': ('-top_rate', '-pk'),
+        'trending': ('-trending_rate', '-pk'),
+    }
+
+    def get_ordering_errors(self):
+        return {'ordering': [f'Valid orderings are {", ".join(self.orderings)}.']}
+
+    def get_posts_queryset(self, ordering, query_params, values=True):
+        """
+        Posts in given ordering, as .values() rows of PostValuesSerializer if values is true
+        """
+        queryset = Post.objects.all().order_by(*self.orderings[ordering])
+        if query_params.get('post_id'):  # get specific post with id
+            queryset = queryset.filter(id=query_params.get('post_id'))
+        if values:
+            ordering_fields = [field.lstrip('-') for field in self.orderings[ordering] if field.lstrip('-') != 'pk']
+            queryset = queryset.values(*PostValuesSerializer.values_fields, *ordering_fields)
+        return queryset
+
+    @staticmethod
+    def has_etag(request, etag):
+        client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+        return etag in client_etags or '*' in client_etags
+
+    def get_rendered_page_response(self, request, etag, body):
+        """
+        Response of a cached json page, or an empty 304 response if the client has the page of given etag
+        """
+        if self.has_etag(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class PostView(PostListMixin, APIView):
+    # user of the token without a database lookup, only its id is needed to read user's rates
+    authentication_classes = (JWTStatelessUserAuthentication,)
     permission_classes = (IsAuthenticatedOrReadOnly, )
+    # serialize the page from .values() rows with PostValuesSerializer instead of PostSerializer
+    use_values_serializer = True
 
     def get(self, request):
         """
-        Get all posts and some details
+        Get all posts and some details, ordered by ordering query param (latest, top or trending)
         """
-        queryset = Post.objects.all().order_by('-created_at')
-        if request.query_params.get('post_id'):  # get specific post with id
-            queryset = queryset.filter(id=request.query_params.get('post_id'))
-        paginator = CustomCursorPagination()
+        ordering = request.query_params.get('ordering', 'latest')
+        if ordering not in self.orderings:
+            return Response(self.get_ordering_errors(), status=status.HTTP_400_BAD_REQUEST)
+        # pages of anonymous users are the same for everyone, they're served as cached json until posts are changed
+        cache_key = None
+        if self.is_cached_request(request):
+            cache_key = get_post_list_cache_key(request)
+            cached_page = get_cached_post_list(cache_key)
+            if cached_page is not None:
+                return self.get_rendered_page_response(request, *cached_page)
+
+        queryset = self.get_posts_queryset(ordering, request.query_params, values=self.use_values_serializer)
+        paginator = CustomCursorPagination()  # pages the queryset in its ordering
         result_page_queryset = paginator.paginate_queryset(queryset, request)
-        serializer = PostSerializer(
-            result_page_queryset,
-            many=True,
-            context={
-                'user': request.user,
+        posts = {post['id'] if self.use_values_serializer else post.id: post for post in result_page_queryset}
+        context = {
+            'user': request.user,
+            # load user's rates of the page with one query instead of one query per post
+            'user_rates': get_user_rates(request.user, list(posts)),
+            # load cached aggregates of the page with one cache round trip instead of two per post
+            'posts_aggregates': get_posts_aggregates(list(posts), posts=posts),
+            # load rating velocity of the page with one redis round trip
+            'posts_velocity': get_posts_velocity(list(posts)),
+        }
+        if self.use_values_serializer:
+            serializer = PostValuesSerializer(result_page_queryset, context=context)
+        else:
+            serializer = PostSerializer(result_page_queryset, many=True, context=context)
+        response = paginator.get_paginated_response(serializer.data)
+        if cache_key is None:
+            return response
+        etag = cache_post_list(cache_key, JSONRenderer().render(response.data))
+        if self.has_etag(request, etag):
+            response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    @staticmethod
+    def is_cached_request(request):
+        return (
+            settings.POST_LIST_CACHE_TIMEOUT > 0 and not request.user.is_authenticated
+            and request.accepted_renderer.format == 'json'
+        )
+
+
+class PostStatsView(APIView):
+    authentication_classes = (JWTStatelessUserAuthentication,)
+    permission_classes = (IsAuthenticatedOrReadOnly, )
+    max_post_ids = 200
+
+    def get(self, request):
+        """
+        Get average rate, rates count and user's rate of the posts of ids query param (comma separated ids),
+        in the order of ids. Ids of posts which don't exist are skipped
+        """
+        try:
+            post_ids = list(dict.fromkeys(int(post_id) for post_id in request.query_params.get('ids', '').split(',')))
+        except ValueError:
+            return Response({'ids': ['Enter comma separated post ids.']}, status=status.HTTP_400_BAD_REQUEST)
+        if len(post_ids) > self.max_post_ids:
+            return Response(
+                {'ids': [f'Ensure there are no more than {self.max_post_ids} ids.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # one cache round trip for aggregates of all posts and one in_bulk of the missed posts
+        posts_aggregates = get_posts_aggregates(post_ids)
+        user_rates = get_user_rates(request.user, [post_id for post_id in post_ids if post_id in posts_aggregates])
+        return Response({'results': [
+            {
+                'pk': post_id,
+                'average_rate': posts_aggregates[post_id]['average_rate'],
+                'rate_counts': posts_aggregates[post_id]['rate_counts'],
+                'user_rate': user_rates.get(post_id),
             }
+            for post_id in post_ids if post_id in posts_aggregates
+        ]})
+
+
+class AsyncPostView(PostListMixin, View):
+    """
+    Async read path of PostView for ASGI servers (uvicorn), a worker serves other requests while one waits on
+    postgres or redis. The page is read with the async ORM, then user's rates, aggregates and rating velocity
+    of the page are read concurrently, redis through the async client
+    """
+
+    async def get(self, request):
+        """
+        Get all posts and some details like PostView, ordered by ordering query param (latest, top or trending)
+        """
+        request = Request(request, authenticators=(JWTStatelessUserAuthentication(), ))
+        try:
+            user = request.user  # user of the token without a database lookup
+            ordering = request.query_params.get('ordering', 'latest')
+            if ordering not in self.orderings:
+                return JsonResponse(self.get_ordering_errors(), status=status.HTTP_400_BAD_REQUEST)
+            cache_key = None
+            if settings.POST_LIST_CACHE_TIMEOUT > 0 and not user.is_authenticated:
+                cache_key = await aget_post_list_cache_key(request)
+                cached_page = await aget_cached_post_list(cache_key)
+                if cached_page is not None:
+                    return self.get_rendered_page_response(request, *cached_page)
+            paginator = CustomCursorPagination()
+            rows = await paginator.apaginate_queryset(self.get_posts_queryset(ordering, request.query_params), request)
+        except APIException as exc:
+            return JsonResponse({'detail': exc.detail}, status=exc.status_code)
+
+        posts = {row['id']: row for row in rows}
+        user_rates, posts_aggregates, posts_velocity = await asyncio.gather(
+            aget_user_rates(user, list(posts)),
+            aget_posts_aggregates(list(posts), posts=posts),
+            aget_posts_velocity(list(posts)),
         )
-        return paginator.get_paginated_response(serializer.data)
+        serializer = PostValuesSerializer(rows, context={
+            'user': user,
+            'user_rates': user_rates,
+            'posts_aggregates': posts_aggregates,
+            'posts_velocity': posts_velocity,
+        })
+        body = JSONRenderer().render(paginator.get_paginated_response(serializer.data).data)
+        if cache_key is None:
+            return HttpResponse(body, content_type='application/json')
+        return self.get_rendered_page_response(request, await acache_post_list(cache_key, body), body)
 
 
 class RateView(APIView):
-    authentication_classes = (JWTAuthentication,)
+    authentication_classes = (CachedUserJWTAuthentication,)
     permission_classes = (IsAuthenticated, )
     throttle_classes = (RateThrottle, )
 
@@ -50,7 +233,36 @@ class RateView(APIView):
         serializer = RateSerializer(data=request.data, context={'user': request.user})
         if serializer.is_valid():
             serializer.save()
+            if settings.RATE_BUFFER_ENABLED:  # rate is accepted and will be written by drain_rate_buffer task
+                return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkRateView(APIView):
+    authentication_classes = (CachedUserJWTAuthentication,)
+    permission_classes = (IsAuthenticated, )
+    throttle_classes = (BulkRateThrottle, )
+
+    def check_throttles(self, request):
+        # a list of more rates than the rate limit is never allowed by the throttle, it's rejected as invalid
+        # instead of a 429 which can't be retried
+        if isinstance(request.data, list) and len(request.data) > BulkRateThrottle.rate_limit:
+            message = BulkRateSerializer.default_error_messages['max_length']
+            raise ValidationError({'non_field_errors': [message.format(max_length=BulkRateThrottle.rate_limit)]})
+        super().check_throttles(request)
+
+    def post(self, request):
+        """
+        Submit a list of at most BulkRateThrottle.rate_limit post rates, each item gets its rate or its errors
+        in results
+        """
+        serializer = BulkRateSerializer(
+            data=request.data, context={'user': request.user}, max_length=BulkRateThrottle.rate_limit,
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        if settings.RATE_BUFFER_ENABLED:  # rates are accepted and will be written by drain_rate_buffer task
+            return Response({'results': serializer.data}, status=status.HTTP_202_ACCEPTED)
+        return Response({'results': serializer.data}, status=status.HTTP_200_OK)
@@ -0,0 +1,497 @@
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (
+    Case, Count, DurationField, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce, Extract, Round
+from django.utils import timezone
+
+from account.models import User
+from .aggregates_cache import invalidate_posts_aggregates
+from .models import Post, Rate, UserWeightDelta
+from .rating_velocity import get_posts_velocity
+from .response_cache import bump_post_list_generation
+
+
+def get_pending_rates():
+    """
+    Rates which have no weight yet. They are read from the partial index of unweighted rates, a rate leaves it
+    in the transaction which weights it, so each run reads only the new rates, and a rate committed late is
+    never skipped like with a time window or an id watermark
+    """
+    return Rate.objects.filter(weight__isnull=True)
+
+
+def add_to_field(field, values):
+    """
+    Expression to add {id: value} to field of each row with one update query,
+    F() keeps the changes of other writers of the same rows
+    """
+    return F(field) + Case(
+        *[When(id=row_id, then=Value(value)) for row_id, value in values.items()],
+        default=Value(0),
+        output_field=FloatField(),
+    )
+
+
+def get_posts_tracked_velocity(post_ids):
+    """
+    Get {post_id: rating velocity} of given posts which are tracked by the rating velocity. It's the recent rates
+    count of these posts in all weighting engines, posts which are not tracked (e.g. rates created out of
+    submit_rate) are counted in database
+    """
+    return {post_id: velocity for post_id, velocity in get_posts_velocity(post_ids).items() if velocity}
+
+
+def get_posts_weighting_data(pending_rates, recent_since):
+    """
+    Get {post_id: data} of the posts of pending rates which is needed to weight their rates, with two queries.
+    Recent rates count of each post is its rating velocity, or its count of rates created since recent_since
+    or not weighted yet if it's not tracked
+    """
+    posts = Post.objects.filter(id__in=pending_rates.order_by().values('post_id')).in_bulk()
+    posts_recent_rates_count = get_posts_tracked_velocity(posts.keys())
+    untracked_post_ids = [post_id for post_id in posts if post_id not in posts_recent_rates_count]
+    if untracked_post_ids:
+        # Count recent rates (created since recent_since or not weighted yet) for each post with one query
+        posts_recent_rates_count.update(
+            Rate.objects.filter(
+                Q(created_at__gte=recent_since) | Q(weight__isnull=True),
+                post_id__in=untracked_post_ids,
+            ).values_list('post_id').annotate(count=Count('id'))
+        )
+    return {
+        post_id: {
+            'rating_speed_weight': post.get_rating_speed_weight(posts_recent_rates_count[post_id]),
+            'standard_deviation': post.standard_deviation,
+            'average_rate': post.normal_average_rate,
+            'rates_count': post.rates_count,
+        }
+        for post_id, post in posts.items()
+    }
+
+
+def weight_pending_rates(recent_since, chunk_size=None):
+    """
+    Calculate weight of rates which have no weight, and add the weighted rates to their posts and users.
+    Rates created since recent_since are counted as recent rates of their posts.
+    Rates are streamed in keyset-paginated chunks and each chunk is committed with a bounded number of queries,
+    so memory and queries per chunk stay the same for any number of rates
+    """
+    weight_rates_in_chunks(get_pending_rates(), recent_since, chunk_size)
+
+
+def weight_rates_in_chunks(pending_rates, recent_since, chunk_size=None, commit=None):
+    """
+    Weight given pending rates chunk by chunk, each chunk is saved by commit function.
+    Rates of a chunk are locked until they are saved and locked rates are skipped, so overlapping runs
+    never weight a rate twice
+    """
+    chunk_size = chunk_size or settings.RATE_WEIGHTING_CHUNK_SIZE
+    commit = commit or commit_weighted_rates
+    posts_weighting_data = get_posts_weighting_data(pending_rates, recent_since)
+
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            chunk = pending_rates.filter(id__gt=last_id).order_by('id').select_related('user').only(
+                'id', 'score', 'post', 'user', 'user__rate_weight'
+            ).select_for_update(skip_locked=True, of=('self',))[:chunk_size]
+            rates = list(chunk.iterator(chunk_size=chunk_size))
+            if not rates:
+                break
+            last_id = rates[-1].id
+            # rates of posts which are rated after loading posts data are weighted by the next run
+            rates = [rate for rate in rates if rate.post_id in posts_weighting_data]
+            commit(rates, *weight_rates(rates, posts_weighting_data))
+
+    invalidate_posts_aggregates(posts_weighting_data.keys())
+    if posts_weighting_data:  # top_rate and average_rate of the weighted posts are changed
+        bump_post_list_generation()
+
+
+def weight_rates(rates, posts_weighting_data):
+    """
+    Set weight and is_outlier of given rates, and return the summed weights per post and per user
+    """
+    posts_weighted_total_rates_sum = {}
+    posts_weighted_rates_count = {}
+    users_total_rates_weight = {}
+
+    for rate in rates:
+        post_data = posts_weighting_data[rate.post_id]
+        is_outlier = rate.get_is_outlier(
+            post_standard_deviation=post_data['standard_deviation'],
+            post_average_rate=post_data['average_rate'],
+            post_rates_count=post_data['rates_count'],
+        )
+        weight = Rate.calculate_weight(post_data['rating_speed_weight'], rate.user.rate_weight, is_outlier)
+        rate.is_outlier = is_outlier
+        rate.weight = weight
+
+        posts_weighted_total_rates_sum[rate.post_id] = (
+            posts_weighted_total_rates_sum.get(rate.post_id, 0) + rate.score * weight
+        )
+        posts_weighted_rates_count[rate.post_id] = posts_weighted_rates_count.get(rate.post_id, 0) + weight
+        users_total_rates_weight[rate.user_id] = users_total_rates_weight.get(rate.user_id, 0) + weight
+
+    return posts_weighted_total_rates_sum, posts_weighted_rates_count, users_total_rates_weight
+
+
+def commit_weighted_rates(rates, posts_weighted_total_rates_sum, posts_weighted_rates_count, users_total_rates_weight):
+    """
+    Save weighted rates and add the summed weights to their posts and users in one transaction
+    """
+    with transaction.atomic():
+        save_weighted_rates(rates, posts_weighted_total_rates_sum, posts_weighted_rates_count)
+        User.objects.filter(id__in=users_total_rates_weight.keys()).update(
+            total_rates_weight=add_to_field('total_rates_weight', users_total_rates_weight),
+        )
+
+
+def commit_weighted_rates_of_shard(
+        rates, posts_weighted_total_rates_sum, posts_weighted_rates_count, users_total_rates_weight
+):
+    """
+    Save weighted rates of a shard and add the summed weights to their posts in one transaction,
+    summed weights of users are saved to be added to users by the callback of the shards
+    """
+    with transaction.atomic():
+        save_weighted_rates(rates, posts_weighted_total_rates_sum, posts_weighted_rates_count)
+        UserWeightDelta.objects.bulk_create([
+            UserWeightDelta(user_id=user_id, weight=weight) for user_id, weight in users_total_rates_weight.items()
+        ])
+
+
+def save_weighted_rates(rates, posts_weighted_total_rates_sum, posts_weighted_rates_count):
+    Rate.objects.bulk_update(rates, ['weight', 'is_outlier'])
+    weighted_total_rates_sum = add_to_field('weighted_total_rates_sum', posts_weighted_total_rates_sum)
+    weighted_rates_count = add_to_field('weighted_rates_count', posts_weighted_rates_count)
+    Post.objects.filter(id__in=posts_weighted_rates_count.keys()).update(
+        weighted_total_rates_sum=weighted_total_rates_sum,
+        weighted_rates_count=weighted_rates_count,
+        top_rate=Post.get_top_rate_expression(weighted_total_rates_sum, weighted_rates_count),
+    )
+
+
+def weight_pending_rates_of_shard(recent_since, shard, shards_count, chunk_size=None):
+    """
+    Weight pending rates of the posts in given shard (post_id % shards_count == shard).
+    Rates of a post are all in one shard, so shards never weight the same rate or change the same post.
+    Rates are weighted only once, so a retried shard only weights its remaining rates
+    """
+    pending_rates = get_pending_rates().alias(post_shard=F('post_id') % shards_count).filter(post_shard=shard)
+    weight_rates_in_chunks(pending_rates, recent_since, chunk_size, commit=commit_weighted_rates_of_shard)
+
+
+def merge_users_weight_deltas():
+    """
+    Add the saved weights of shards to users' total_rates_weight and remove them in one transaction
+    """
+    with transaction.atomic():
+        deltas = UserWeightDelta.objects.select_for_update()
+        delta_ids = []
+        users_total_rates_weight = {}
+        for delta_id, user_id, weight in deltas.values_list('id', 'user_id', 'weight'):
+            delta_ids.append(delta_id)
+            users_total_rates_weight[user_id] = users_total_rates_weight.get(user_id, 0) + weight
+        User.objects.filter(id__in=users_total_rates_weight.keys()).update(
+            total_rates_weight=add_to_field('total_rates_weight', users_total_rates_weight),
+        )
+        UserWeightDelta.objects.filter(id__in=delta_ids).delete()
+
+
+def weight_pending_rates_numpy(recent_since, chunk_size=None):
+    """
+    Same calculation as weight_pending_rates on columns of each chunk with numpy,
+    to catch up with a large backlog of pending rates
+    """
+    chunk_size = chunk_size or settings.RATE_WEIGHTING_CHUNK_SIZE
+    pending_rates = get_pending_rates()
+    posts_weighting_data = get_posts_weighting_data(pending_rates, recent_since)
+    posts_columns = get_posts_columns(posts_weighting_data)
+
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(pending_rates.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'score', 'post_id', 'user_id', 'user__rate_weight'
+            ).select_for_update(skip_locked=True, of=('self',))[:chunk_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            weight_rows_columns(rows, posts_columns)
+
+    invalidate_posts_aggregates(posts_weighting_data.keys())
+    if posts_weighting_data:  # top_rate and average_rate of the weighted posts are changed
+        bump_post_list_generation()
+
+
+def weight_rows_columns(rows, posts_columns):
+    """
+    Weight a chunk of (id, score, post_id, user_id, user_weight) rows with numpy and commit them
+    """
+    ids, scores, post_ids, user_ids, user_weights = (np.array(column) for column in zip(*rows))
+    # rates of posts which are rated after loading posts data are weighted by the next run
+    known_posts = np.isin(post_ids, posts_columns['post_id'])
+    if not known_posts.all():
+        ids, scores, post_ids, user_ids, user_weights = (
+            column[known_posts] for column in (ids, scores, post_ids, user_ids, user_weights)
+        )
+
+    if not len(ids):
+        return
+
+    post_indexes = np.searchsorted(posts_columns['post_id'], post_ids)
+    weights, is_outliers = weight_rates_columns(scores, post_indexes, user_weights, posts_columns)
+
+    # sum the weights per post and per user
+    posts_weighted_total_rates_sum = np.bincount(post_indexes, weights=scores * weights)
+    posts_weighted_rates_count = np.bincount(post_indexes, weights=weights)
+    rated_post_indexes = np.unique(post_indexes)
+    rate_user_ids, user_indexes = np.unique(user_ids, return_inverse=True)
+    users_total_rates_weight = np.bincount(user_indexes, weights=weights)
+
+    commit_weighted_rates(
+        [
+            Rate(id=int(rate_id), weight=float(weight), is_outlier=bool(is_outlier))
+            for rate_id, weight, is_outlier in zip(ids, weights, is_outliers)
+        ],
+        {
+            int(posts_columns['post_id'][index]): float(posts_weighted_total_rates_sum[index])
+            for index in rated_post_indexes
+        },
+        {
+            int(posts_columns['post_id'][index]): float(posts_weighted_rates_count[index])
+            for index in rated_post_indexes
+        },
+        {int(user_id): float(weight) for user_id, weight in zip(rate_user_ids, users_total_rates_weight)},
+    )
+
+
+def get_posts_columns(posts_weighting_data):
+    """
+    Arrays of posts weighting data sorted by post id, missing values are nan
+    """
+    post_ids = sorted(posts_weighting_data)
+    columns = {'post_id': np.array(post_ids, dtype=np.int64)}
+    for field in ['rating_speed_weight', 'standard_deviation', 'average_rate', 'rates_count']:
+        columns[field] = np.array(
+            [posts_weighting_data[post_id][field] for post_id in post_ids], dtype=np.float64
+        )
+    return columns
+
+
+def weight_rates_columns(scores, post_indexes, user_weights, posts_columns):
+    """
+    Vectorized Rate.get_is_outlier and Rate.calculate_weight, return arrays of weights and is_outlier of rates
+    """
+    standard_deviation = posts_columns['standard_deviation'][post_indexes]
+    average_rate = posts_columns['average_rate'][post_indexes]
+    min_value = average_rate - (Rate.STANDARD_DEVIATION_RATIO * standard_deviation)
+    max_value = average_rate + (Rate.STANDARD_DEVIATION_RATIO * standard_deviation)
+    with np.errstate(invalid='ignore'):  # nan values are compared for posts without average rate
+        in_range = (min_value <= scores) & (scores <= max_value)
+    is_outliers = (
+        (posts_columns['rates_count'][post_indexes] >= Rate.MIN_TOTAL_RATES_REQUIRED)
+        & ~np.isnan(standard_deviation)
+        & ~np.isnan(average_rate)
+        & ~in_range
+    )
+
+    rating_speed_weights = posts_columns['rating_speed_weight'][post_indexes]
+    weights = (
+        (Rate.RATING_SPEED_WEIGHT_RATIO * rating_speed_weights + Rate.USER_WEIGHT_RATIO * user_weights)
+        / (Rate.RATING_SPEED_WEIGHT_RATIO + Rate.USER_WEIGHT_RATIO)
+    )
+    # numpy and python round differently only near a tie, those weights are rounded with Rate.calculate_weight
+    scaled_weights = weights * 1000
+    near_tie = np.abs(scaled_weights - np.floor(scaled_weights) - 0.5) < 1e-6
+    weights = np.round(weights, 3)
+    weights[near_tie] = [
+        Rate.calculate_weight(float(rating_speed_weight), float(user_weight), False)
+        for rating_speed_weight, user_weight in zip(rating_speed_weights[near_tie], user_weights[near_tie])
+    ]
+    weights[is_outliers] = 0
+    return weights, is_outliers
+
+
+def update_average_rating_speed(posts):
+    """
+    Same calculation as Post.calculate_average_rating_speed for given posts with one update query
+    """
+    hours = 5
+    now = timezone.now()
+    age_seconds = Extract(ExpressionWrapper(Value(now) - F('created_at'), output_field=DurationField()), 'epoch')
+    posts.update(average_rating_speed=Case(
+        When(
+            created_at__lt=now,
+            then=Round(F('rates_count') / (age_seconds / (hours * 60 * 60)), 3),  # Ratings per 5 hours
+        ),
+        default=F('rates_count'),
+        output_field=FloatField(),
+    ))
+
+
+def update_trending_rates(recent_since):
+    """
+    Set trending_rate of posts to their count of rates created since recent_since with one update query,
+    only posts with recent rates or a previous trending rate whose count is changed are updated
+    """
+    recent_rates = Rate.objects.filter(post=OuterRef('pk'), created_at__gte=recent_since)
+    recent_rates_count = recent_rates.order_by().values('post').annotate(count=Count('id')).values('count')
+    recent_post_ids = Rate.objects.filter(created_at__gte=recent_since).values('post_id')
+    trending_rate = Coalesce(Subquery(recent_rates_count), 0)
+    updated_count = Post.objects.filter(
+        Q(trending_rate__gt=0) | Q(id__in=recent_post_ids),
+    ).alias(new_trending_rate=trending_rate).exclude(trending_rate=F('new_trending_rate')).update(
+        trending_rate=trending_rate,
+    )
+    if updated_count:  # trending page is changed
+        bump_post_list_generation()
+
+
+WEIGHT_PENDING_RATES_SQL = """
+WITH pending_rates AS (
+    SELECT rate.id, rate.post_id, rate.user_id, rate.score, rate_user.rate_weight
+    FROM {rate_table} rate
+    JOIN {user_table} rate_user ON rate_user.id = rate.user_id
+    WHERE rate.weight IS NULL
+),
+posts_velocity AS (
+    SELECT * FROM UNNEST(%(velocity_post_ids)s::bigint[], %(velocity_counts)s::bigint[])
+        AS velocity(post_id, recent_rates_count)
+),
+posts_recent_rates_count AS (
+    SELECT post_id, recent_rates_count FROM posts_velocity
+    WHERE post_id IN (SELECT post_id FROM pending_rates)
+    UNION ALL
+    SELECT post_id, COUNT(*) AS recent_rates_count
+    FROM {rate_table}
+    WHERE post_id IN (SELECT post_id FROM pending_rates) AND post_id NOT IN (SELECT post_id FROM posts_velocity)
+        AND (created_at >= %(recent_since)s OR weight IS NULL)
+    GROUP BY post_id
+),
+posts_average_rate AS (
+    SELECT
+        post.id AS post_id,
+        post.rates_count,
+        post.total_rates_sum,
+        post.total_rates_sum_squared,
+        CASE WHEN post.rates_count > 0 AND post.total_rates_sum > 0
+            THEN blog_round(post.total_rates_sum::float8 / post.rates_count, 3)
+        END AS average_rate,
+        LEAST(blog_round(post.average_rating_speed / recent.recent_rates_count, 3), 1) AS rating_speed_weight
+    FROM {post_table} post
+    JOIN posts_recent_rates_count recent ON recent.post_id = post.id
+),
+posts_statistics AS (
+    SELECT
+        *,
+        CASE WHEN rates_count > 0 THEN blog_round(SQRT(
+            (rates_count::numeric * total_rates_sum_squared - total_rates_sum::numeric ^ 2)::float8
+            / (rates_count::numeric ^ 2)::float8
+        ), 3) END AS standard_deviation
+    FROM posts_average_rate
+),
+rates_outlier AS (
+    SELECT
+        pending_rates.*,
+        post.rating_speed_weight,
+        (
+            post.rates_count >= %(min_total_rates_required)s
+            AND post.standard_deviation IS NOT NULL
+            AND post.average_rate IS NOT NULL
+            AND NOT (
+                pending_rates.score BETWEEN post.average_rate - %(standard_deviation_ratio)s * post.standard_deviation
+                AND post.average_rate + %(standard_deviation_ratio)s * post.standard_deviation
+            )
+        ) AS is_outlier
+    FROM pending_rates
+    JOIN posts_statistics post ON post.post_id = pending_rates.post_id
+),
+rates_weight AS (
+    SELECT
+        id, post_id, user_id, score, is_outlier,
+        CASE WHEN is_outlier THEN 0 ELSE blog_round(
+            (%(rating_speed_weight_ratio)s * rating_speed_weight + %(user_weight_ratio)s * rate_weight)
+            / (%(rating_speed_weight_ratio)s + %(user_weight_ratio)s), 3
+        ) END AS weight
+    FROM rates_outlier
+),
+updated_rates AS (
+    UPDATE {rate_table} rate
+    SET weight = rates_weight.weight, is_outlier = rates_weight.is_outlier
+    FROM rates_weight
+    WHERE rate.id = rates_weight.id AND rate.weight IS NULL  -- skip rates weighted by an overlapping run
+    RETURNING rates_weight.post_id, rates_weight.user_id, rates_weight.score, rates_weight.weight
+),
+updated_posts AS (
+    UPDATE {post_table} post
+    SET
+        weighted_total_rates_sum = post.weighted_total_rates_sum + posts_weight.weighted_total_rates_sum,
+        weighted_rates_count = post.weighted_rates_count + posts_weight.weighted_rates_count,
+        top_rate = COALESCE(ROUND((
+            (post.weighted_total_rates_sum + posts_weight.weighted_total_rates_sum)
+            / NULLIF(post.weighted_rates_count + posts_weight.weighted_rates_count, 0)
+        )::numeric, 3)::float8, 0)
+    FROM (
+        SELECT post_id, SUM(score * weight) AS weighted_total_rates_sum, SUM(weight) AS weighted_rates_count
+        FROM updated_rates GROUP BY post_id
+    ) posts_weight
+    WHERE post.id = posts_weight.post_id
+    RETURNING post.id
+),
+updated_users AS (
+    UPDATE {user_table} rate_user
+    SET total_rates_weight = rate_user.total_rates_weight + users_weight.total_rates_weight
+    FROM (SELECT user_id, SUM(weight) AS total_rates_weight FROM updated_rates GROUP BY user_id) users_weight
+    WHERE rate_user.id = users_weight.user_id
+)
+SELECT id FROM updated_posts
+"""
+
+
+def weight_pending_rates_sql(recent_since):
+    """
+    Same calculation as weight_pending_rates (Rate.get_is_outlier, Rate.calculate_weight and
+    Post.get_rating_speed_weight) in one sql statement, without loading any rate in python.
+    Values are rounded with blog_round function, which rounds like round() of python.
+    Rating velocity of the posts of pending rates is passed to the statement as their recent rates count
+    """
+    pending_post_ids = get_pending_rates().order_by().values_list('post_id', flat=True).distinct()
+    posts_velocity = get_posts_tracked_velocity(pending_post_ids)
+    sql = WEIGHT_PENDING_RATES_SQL.format(
+        rate_table=Rate._meta.db_table,
+        post_table=Post._meta.db_table,
+        user_table=User._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'recent_since': recent_since,
+            'velocity_post_ids': list(posts_velocity),
+            'velocity_counts': list(posts_velocity.values()),
+            'standard_deviation_ratio': Rate.STANDARD_DEVIATION_RATIO,
+            'min_total_rates_required': Rate.MIN_TOTAL_RATES_REQUIRED,
+            'rating_speed_weight_ratio': Rate.RATING_SPEED_WEIGHT_RATIO,
+            'user_weight_ratio': Rate.USER_WEIGHT_RATIO,
+        })
+        post_ids = [row[0] for row in cursor.fetchall()]
+    invalidate_posts_aggregates(post_ids)
+    if post_ids:  # top_rate and average_rate of the weighted posts are changed
+        bump_post_list_generation()
+
+
+WEIGHTING_ENGINES = {
+    'python': weight_pending_rates,
+    'numpy': weight_pending_rates_numpy,
+    'sql': weight_pending_rates_sql,
+}
+
+
+def get_weighting_engine():
+    """
+    Weighting function selected by RATE_WEIGHTING_ENGINE setting
+    """
+    return WEIGHTING_ENGINES[settings.RATE_WEIGHTING_ENGINE]
@@ -4,7 +4,7 @@ from celery.schedules import crontab
 CELERY_BEAT_SCHEDULE = {
     'calculate_post_total_rates_amount': {
         'task': 'calculate_post_total_rates_amount',
-        'schedule': 18000,
+        'schedule': 60,
         'options': {'queue': 'periodic_queue'}
     },
     'calculate_post_average_rating_speed': {
@@ -12,6 +12,11 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': 86400,
         'options': {'queue': 'periodic_queue'}
     },
+    'write_buffered_rates': {
+        'task': 'write_buffered_rates',
+        'schedule': 5,
+        'options': {'queue': 'periodic_queue'}
+    },
     'user_rate_weight': {
         'task': 'user_rate_weight',
         'schedule': 86400,
@@ -145,6 +145,9 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Users of the authentication of rate submissions are cached for this many seconds, they're removed on save
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', 60))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
@@ -167,6 +170,28 @@ CACHES = {
     }
 }
 
+# In-process cache of post aggregates in front of redis, timeout is in seconds (0 disables it)
+POST_AGGREGATES_LOCAL_CACHE_TIMEOUT = int(os.getenv('POST_AGGREGATES_LOCAL_CACHE_TIMEOUT', 5))
+POST_AGGREGATES_LOCAL_CACHE_SIZE = int(os.getenv('POST_AGGREGATES_LOCAL_CACHE_SIZE', 10000))
+# Rendered post list pages of anonymous users are cached for this many seconds (0 disables it)
+POST_LIST_CACHE_TIMEOUT = int(os.getenv('POST_LIST_CACHE_TIMEOUT', 30))
+
+# Rate ingestion settings
+# if enabled, accepted rates are pushed to a redis buffer and written to database in batches by write_buffered_rates task
+RATE_BUFFER_ENABLED = os.getenv('RATE_BUFFER_ENABLED', 'False') == 'True'
+RATE_BUFFER_BATCH_SIZE = int(os.getenv('RATE_BUFFER_BATCH_SIZE', 1000))
+
+# Rate weighting settings
+# 'python' weights rates in chunks in python, 'numpy' weights columns of each chunk with numpy,
+# 'sql' weights all pending rates with one sql statement
+RATE_WEIGHTING_ENGINE = os.getenv('RATE_WEIGHTING_ENGINE', 'python')
+RATE_WEIGHTING_CHUNK_SIZE = int(os.getenv('RATE_WEIGHTING_CHUNK_SIZE', 2000))
+# if more than 1, rates are split by post between shards which are weighted by celery workers in parallel
+RATE_WEIGHTING_SHARDS = int(os.getenv('RATE_WEIGHTING_SHARDS', 1))
+
+# User rate weight settings
+USER_RATE_WEIGHT_CHUNK_SIZE = int(os.getenv('USER_RATE_WEIGHT_CHUNK_SIZE', 2000))
+
 # Celery settings
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
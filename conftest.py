@@ -1,9 +1,42 @@
 import pytest
 from unittest.mock import patch
 
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from blog.response_cache import bump_post_list_generation
+
 @pytest.fixture(autouse=True)
 def mock_celery_tasks():
     with patch('blog.tasks.calculate_post_total_rates_amount.delay') as calculate_post_total_rates_amount_task:
         with patch('blog.tasks.calculate_post_average_rating_speed.delay') as calculate_post_average_rating_speed_task:
             with patch('account.tasks.user_rate_weight.delay') as user_rate_weight_task:
                 yield calculate_post_total_rates_amount_task, calculate_post_average_rating_speed_task, user_rate_weight_task
+
+
+@pytest.fixture(autouse=True)
+def new_post_list_generation():
+    # posts of each test are rolled back without changing the generation, so post list pages cached by other tests
+    # are not reused
+    bump_post_list_generation()
+
+
+@pytest.fixture(autouse=True)
+def clear_throttles():
+    # throttles are counted in redis, which is not rolled back like the database
+    redis = get_redis_connection('default')
+    keys = list(redis.scan_iter('THROTTLE_*'))
+    if keys:
+        redis.delete(*keys)
+
+
+@pytest.fixture(autouse=True, scope='session')
+def clear_posts_cache():
+    # ids of the test database start from 1 in each run, so cached values of posts and users of previous runs
+    # are removed
+    cache.delete_pattern('*_POST')
+    cache.delete_pattern('*_USER')
+    redis = get_redis_connection('default')
+    keys = list(redis.scan_iter('RATING_VELOCITY_*'))
+    if keys:
+        redis.delete(*keys)
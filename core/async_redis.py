@@ -0,0 +1,53 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+from redis import asyncio as aioredis
+
+# connections of an async client belong to the event loop which opened them, so there's one client for each loop
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis_connection():
+    """
+    Async redis client of the default cache location for the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = aioredis.Redis.from_url(settings.CACHES['default']['LOCATION'])
+    return client
+
+
+async def close_async_redis_connection():
+    """
+    Close the client of the running event loop, before the loop is closed
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def cache_aget_many(keys):
+    """
+    Async get_many of the default cache, values are read with one MGET of the async client and decoded like
+    django-redis, so values of the sync and async paths are shared
+    """
+    keys = list(keys)
+    if not keys:
+        return {}
+    values = await get_async_redis_connection().mget([cache.make_key(key) for key in keys])
+    return {key: cache.client.decode(value) for key, value in zip(keys, values) if value is not None}
+
+
+async def cache_aset_many(values, timeout):
+    """
+    Async set_many of the default cache with one pipeline of the async client
+    """
+    if not values:
+        return
+    pipeline = get_async_redis_connection().pipeline(transaction=False)
+    for key, value in values.items():
+        pipeline.set(cache.make_key(key), cache.client.encode(value), ex=timeout)
+    await pipeline.execute()
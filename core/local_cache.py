@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache with a ttl for each value, used in front of redis for the hottest keys.
+    Values are kept only for a few seconds, so a missed invalidation makes them stale only for a short time
+    """
+
+    def __init__(self, timeout, max_size):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """
+        Get {key: value} of the keys which are cached and not expired
+        """
+        values = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                item = self._values.get(key)
+                if item is None or item[1] < now:
+                    self._values.pop(key, None)
+                    self.misses += 1
+                    continue
+                self._values.move_to_end(key)
+                values[key] = item[0]
+                self.hits += 1
+        return values
+
+    def set_many(self, values):
+        if not self.timeout or not self.max_size:
+            return
+        expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = (value, expires_at)
+                self._values.move_to_end(key)
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)  # remove the least recently used value
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def __len__(self):
+        return len(self._values)
@@ -1,6 +1,174 @@
+import json
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+KeysetCursor = namedtuple('KeysetCursor', ['position', 'reverse'])
 
 
 class CustomCursorPagination(CursorPagination):
+    """
+    Cursor pagination on the ordering of the queryset (or ordering attribute if the queryset is not ordered).
+    The cursor keeps the values of all ordering fields of an item, e.g. (created_at, pk), so a page is read from
+    the index of the ordering with one query of page_size + 1 rows, without an offset or a count.
+    The response has has_more besides the next and previous links
+    """
     page_size = 10
     ordering = '-pk'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = queryset.query.order_by or self.ordering
+        ordering = (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        if ordering[-1].lstrip('-') not in ('pk', 'id'):  # pk makes the position of each item unique
+            ordering += ('-pk' if ordering[-1].startswith('-') else 'pk',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async paginate_queryset, the page is read with the async ORM
+        """
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page([item async for item in page_queryset.aiterator()])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Queryset of page_size + 1 items from the cursor position, the extra item tells if there are more items
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor.reverse
+
+        # previous page is read in the reversed ordering from the first item of current page
+        ordering = [self.reverse_field(field) for field in self.ordering] if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            position = self.get_position_values(queryset.model, self.cursor.position)
+            queryset = queryset.filter(self.get_keyset_filter(ordering, position))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next, self.has_previous = has_following, self.cursor is not None
+        return self.page
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def get_field_name(self, field):
+        return field.lstrip('-')
+
+    def get_keyset_filter(self, ordering, position):
+        """
+        Items after the position in given ordering: f1 < v1 or (f1 = v1 and (f2 < v2 or ...)) for descending fields.
+        The redundant f1 <= v1 bound lets the database start the index scan from the position
+        """
+        keyset_filter = None
+        for field, value in reversed(list(zip(ordering, position))):
+            name = self.get_field_name(field)
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': value})
+            if keyset_filter is not None:
+                condition |= Q(**{name: value}) & keyset_filter
+            keyset_filter = condition
+        first_name = self.get_field_name(ordering[0])
+        first_lookup = 'lte' if ordering[0].startswith('-') else 'gte'
+        return Q(**{f'{first_name}__{first_lookup}': position[0]}) & keyset_filter
+
+    def get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):  # a .values() row which has the ordering fields
+            instance = SimpleNamespace(**instance)
+        return [self.get_model_field(self.model, field).value_to_string(instance) for field in ordering]
+
+    def get_model_field(self, model, field):
+        name = self.get_field_name(field)
+        return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+    def get_position_values(self, model, position):
+        """
+        Values of the cursor position as python values of the ordering fields
+        """
+        try:
+            return [
+                self.get_model_field(model, field).to_python(value) for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            position, reverse = data['p'], bool(data['r'])
+            # a position is the list of the scalar values of the ordering fields
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            if not all(isinstance(value, (str, int, float)) for value in position):
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return KeysetCursor(position=position, reverse=reverse)
+
+    def encode_cursor(self, cursor):
+        encoded = b64encode(json.dumps({'p': cursor.position, 'r': int(cursor.reverse)}).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:  # empty previous page, the next page starts from the cursor again
+            return self.encode_cursor(KeysetCursor(position=self.cursor.position, reverse=False))
+        return self.encode_cursor(
+            KeysetCursor(position=self.get_position_from_instance(self.page[-1], self.ordering), reverse=False)
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(
+            KeysetCursor(position=self.get_position_from_instance(self.page[0], self.ordering), reverse=True)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'has_more': self.has_next,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['has_more'] = {'type': 'boolean'}
+        return response_schema
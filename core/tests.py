@@ -1,3 +1,71 @@
-from django.test import TestCase
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
+from core.local_cache import LocalCache
+from core.throttling import check_rate
+
+
+class TestLocalCache:
+
+    def test_get_many(self):
+        local_cache = LocalCache(timeout=5, max_size=10)
+        local_cache.set_many({'a': 1, 'b': None})
+        assert local_cache.get_many(['a', 'b', 'c']) == {'a': 1, 'b': None}
+        assert local_cache.hits == 2
+        assert local_cache.misses == 1
+
+    def test_timeout(self):
+        local_cache = LocalCache(timeout=0.01, max_size=10)
+        local_cache.set_many({'a': 1})
+        time.sleep(0.02)
+        assert local_cache.get_many(['a']) == {}
+        assert len(local_cache) == 0
+
+    def test_max_size(self):
+        local_cache = LocalCache(timeout=5, max_size=2)
+        local_cache.set_many({'a': 1, 'b': 2})
+        local_cache.get_many(['a'])  # 'b' is the least recently used value now
+        local_cache.set_many({'c': 3})
+        assert local_cache.get_many(['a', 'b', 'c']) == {'a': 1, 'c': 3}
+
+    def test_delete_many(self):
+        local_cache = LocalCache(timeout=5, max_size=10)
+        local_cache.set_many({'a': 1, 'b': 2})
+        local_cache.delete_many(['a'])
+        assert local_cache.get_many(['a', 'b']) == {'b': 2}
+
+    def test_disabled(self):
+        local_cache = LocalCache(timeout=0, max_size=10)
+        local_cache.set_many({'a': 1})
+        assert local_cache.get_many(['a']) == {}
+
+
+class TestCheckRate:
+
+    def test_limit(self):
+        results = [check_rate('THROTTLE_test_limit', limit=3, duration=60) for _ in range(4)]
+        assert [allowed for allowed, wait in results] == [True, True, True, False]
+        assert 59 < results[-1][1] <= 60  # until the first request leaves the window
+
+    def test_cost(self):
+        assert check_rate('THROTTLE_test_cost', limit=10, duration=60, cost=8) == (True, 0)
+        assert not check_rate('THROTTLE_test_cost', limit=10, duration=60, cost=3)[0]
+        assert check_rate('THROTTLE_test_cost', limit=10, duration=60, cost=2) == (True, 0)
+
+    def test_cost_over_limit(self):
+        assert check_rate('THROTTLE_test_cost_over_limit', limit=10, duration=60, cost=11) == (False, None)
+        assert check_rate('THROTTLE_test_cost_over_limit', limit=10, duration=60, cost=10) == (True, 0)
+
+    def test_sliding_window(self):
+        assert check_rate('THROTTLE_test_window', limit=2, duration=0.2)[0]
+        time.sleep(0.1)
+        assert check_rate('THROTTLE_test_window', limit=2, duration=0.2)[0]
+        assert not check_rate('THROTTLE_test_window', limit=2, duration=0.2)[0]
+        time.sleep(0.11)  # only the first request left the window
+        assert check_rate('THROTTLE_test_window', limit=2, duration=0.2)[0]
+        assert not check_rate('THROTTLE_test_window', limit=2, duration=0.2)[0]
+
+    def test_concurrent_requests(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: check_rate('THROTTLE_test_concurrent', 25, 60)[0], range(100)))
+        assert results.count(True) == 25
@@ -0,0 +1,91 @@
+from django_redis import get_redis_connection
+from rest_framework.throttling import SimpleRateThrottle
+
+# Sliding window log: the key is a sorted set of the requests of the last duration with their time in milliseconds
+# as score. Requests older than one duration are removed, and a request is allowed if the requests left and its
+# cost are at most limit, so limit is exact for any rolling duration. A request of cost n adds n members, which are
+# unique as the count of a key only grows in the same millisecond.
+# The check and the update are one atomic script on redis time, so it's exact for any number of workers
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local duration = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - duration)
+local count = redis.call('ZCARD', KEYS[1])
+if count + cost > limit then
+    -- allowed again when the oldest requests which are over the limit leave the window
+    local oldest = redis.call('ZRANGE', KEYS[1], count + cost - limit - 1, count + cost - limit - 1, 'WITHSCORES')
+    return {0, math.ceil(tonumber(oldest[2]) + duration - now)}
+end
+for i = 1, cost do
+    redis.call('ZADD', KEYS[1], now, now .. '-' .. (count + i))
+end
+redis.call('PEXPIRE', KEYS[1], math.ceil(duration))
+return {1, 0}
+"""
+
+_sliding_window_script = None
+
+
+def check_rate(key, limit, duration, cost=1):
+    """
+    Count a request of given cost against limit requests per duration seconds of the key with one redis round trip,
+    return (allowed, seconds to wait until it would be allowed, or None if it's never allowed)
+    """
+    global _sliding_window_script
+    if cost > limit:  # never allowed, so it's not counted
+        return False, None
+    if _sliding_window_script is None:  # sent with EVALSHA, and loaded again by redis-py if the script cache is flushed
+        _sliding_window_script = get_redis_connection('default').register_script(SLIDING_WINDOW_SCRIPT)
+    allowed, wait_milliseconds = _sliding_window_script(keys=[key], args=[limit, duration * 1000, cost])
+    return bool(allowed), wait_milliseconds / 1000
+
+
+class RedisRateThrottle(SimpleRateThrottle):
+    """
+    Rate throttle which is checked by an atomic sliding window script in redis instead of a history which is read
+    and written back to the cache, shared by all workers. The cost of a request is 1 unless get_cost is overridden
+    """
+    cache_format = 'THROTTLE_%(scope)s_%(ident)s'
+    wait_seconds = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        allowed, self.wait_seconds = check_rate(
+            self.key, self.num_requests, self.duration, self.get_cost(request, view),
+        )
+        return allowed
+
+    def get_cost(self, request, view):
+        return 1
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserRedisRateThrottle(RedisRateThrottle):
+    """
+    Throttle of authenticated users by their id, and anonymous users by their ip
+    """
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class AnonRedisRateThrottle(RedisRateThrottle):
+    """
+    Throttle of requests by ip, for views of anonymous users like signup and login
+    """
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}